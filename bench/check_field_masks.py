@@ -0,0 +1,159 @@
+"""
+Field mask check - verifies the FIELD_MASKS partial responses still carry everything
+the parser and sync logic read, and reports how much smaller the responses are
+
+Every message of a synthetic mailbox (plus deeply nested and header-less edge cases)
+is fetched twice from the local Gmail fake, with and without field masks, and the
+results are compared: parsed rows, dedup keys (both DEDUP_KEY modes), metadata-first
+keys and the labels incremental sync filters on.
+
+Usage:
+    python bench/check_field_masks.py --messages 500
+
+Exits with status 1 if any masked response parses differently.
+"""
+
+import argparse
+import base64
+import contextlib
+import copy
+import io
+import os
+import sys
+import time
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config
+from src.email_parser import get_dedup_key, parse_email_record
+from src.gmail_service import fetch_messages, fetch_message_metadata
+from bench.fakes import DEFAULT_MIX, build_mailbox
+from bench.run_benchmarks import build_fake_services, parse_mix
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def edge_cases(template):
+    """
+    Messages the synthetic mix does not cover: MIME trees deeper than the mask spells out,
+    no Message-ID header, an empty body and a text/plain part after an attachment
+    """
+    messages = []
+
+    deep = copy.deepcopy(template)
+    part = {'mimeType': 'text/plain', 'body': {'data': _b64('Seven levels down')}}
+    for _ in range(6):
+        part = {'mimeType': 'multipart/mixed', 'headers': [{'name': 'X-Level', 'value': 'x'}], 'parts': [part]}
+    deep['payload'] = dict(part, headers=template['payload']['headers'])
+    messages.append(deep)
+
+    no_id = copy.deepcopy(template)
+    no_id['payload']['headers'] = [h for h in no_id['payload']['headers'] if h['name'] != 'Message-ID']
+    messages.append(no_id)
+
+    empty = copy.deepcopy(template)
+    empty['payload'] = {'mimeType': 'text/plain', 'headers': template['payload']['headers'], 'body': {'size': 0}}
+    messages.append(empty)
+
+    attachment_first = copy.deepcopy(template)
+    attachment_first['payload'] = {
+        'mimeType': 'multipart/mixed',
+        'headers': template['payload']['headers'],
+        'parts': [
+            {'mimeType': 'application/pdf', 'filename': 'a.pdf', 'body': {'attachmentId': 'x', 'size': 10}},
+            {'mimeType': 'text/plain', 'body': {'data': _b64('After the attachment')}},
+        ]
+    }
+    messages.append(attachment_first)
+
+    for i, message in enumerate(messages):
+        message['id'] = f'edge{i}'
+    return messages
+
+
+def fetch_all(gmail_service, gmail_http, stubs, masks):
+    """
+    Fetch full and metadata messages with the given FIELD_MASKS
+    Returns: tuple (full messages, metadata messages, bytes received)
+    """
+    config.FIELD_MASKS = masks
+    before = gmail_http.bytes_sent
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = fetch_messages(gmail_service, stubs)
+        metadata = fetch_message_metadata(gmail_service, stubs)
+    return full, metadata, gmail_http.bytes_sent - before
+
+
+def compare(full_masked, full_plain, metadata_masked, metadata_plain):
+    """
+    Returns: list of mismatch descriptions
+    """
+    problems = []
+    for masked, plain in zip(full_masked, full_plain):
+        if set(masked.get('labelIds', [])) != set(plain.get('labelIds', [])):
+            problems.append(f"{plain['id']}: labelIds differ")
+        for mode in ('headers', 'message_id'):
+            config.DEDUP_KEY = mode
+            with contextlib.redirect_stdout(io.StringIO()):
+                a, b = parse_email_record(masked), parse_email_record(plain)
+            if (a.key, a.content) != (b.key, b.content):
+                problems.append(f"{plain['id']}: parsed row differs with DEDUP_KEY = '{mode}'")
+
+    for masked, plain in zip(metadata_masked, metadata_plain):
+        for mode in ('headers', 'message_id'):
+            config.DEDUP_KEY = mode
+            with contextlib.redirect_stdout(io.StringIO()):
+                if get_dedup_key(masked) != get_dedup_key(plain):
+                    problems.append(f"{plain['id']}: metadata dedup key differs with DEDUP_KEY = '{mode}'")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check FIELD_MASKS against the parser')
+    parser.add_argument('--messages', type=int, default=500, help='synthetic mailbox size')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='message mix, e.g. plain=40,nested=30,html=20,duplicate=10')
+    args = parser.parse_args()
+
+    messages, _ = build_mailbox(args.messages, args.mix)
+    messages += edge_cases(messages[0])
+    gmail_service, gmail_http, _, _ = build_fake_services(messages, [])
+    stubs = [{'id': message['id']} for message in messages]
+
+    masks = config.FIELD_MASKS
+    dedup_key = config.DEDUP_KEY
+    config.MAX_CONTENT_CHARS = None  # Compare whole bodies
+    try:
+        start = time.perf_counter()
+        full_plain, metadata_plain, plain_bytes = fetch_all(gmail_service, gmail_http, stubs, {})
+        plain_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        full_masked, metadata_masked, masked_bytes = fetch_all(gmail_service, gmail_http, stubs, masks)
+        masked_seconds = time.perf_counter() - start
+
+        problems = []
+        if len(full_masked) != len(full_plain) or len(metadata_masked) != len(metadata_plain):
+            problems.append("masked fetch returned a different number of messages")
+        problems += compare(full_masked, full_plain, metadata_masked, metadata_plain)
+    finally:
+        config.FIELD_MASKS = masks
+        config.DEDUP_KEY = dedup_key
+
+    print(f"Messages checked: {len(messages)} ({len(messages) - args.messages} edge cases)")
+    print(f"Response bytes: {plain_bytes:,} without masks, {masked_bytes:,} with masks "
+          f"({1 - masked_bytes / plain_bytes:.0%} smaller)")
+    print(f"Fetch + decode: {plain_seconds:.2f}s without masks, {masked_seconds:.2f}s with masks")
+
+    if problems:
+        print(f"\n{len(problems)} problem(s):")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("OK: masked responses parse the same as full responses")
+
+
+if __name__ == '__main__':
+    main()
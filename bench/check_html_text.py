@@ -0,0 +1,157 @@
+"""
+HTML engine check - verifies html_to_text_fast gives the same text as html_to_text_bs4
+and reports how much faster it is
+
+The corpus is generated: the synthetic mailbox's HTML bodies, hand-written edge cases
+(entities, nested tables, br/p/li, script/style, comments, CDATA, pre, whitespace-only
+text, malformed markup) and random tag soup built from the same pieces. Files from
+--corpus-dir (e.g. saved HTML bodies of real mail) are checked too.
+
+Usage:
+    python bench/check_html_text.py --random 2000
+    python bench/check_html_text.py --corpus-dir saved_html/
+
+Exits with status 1 if any document converts differently.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.email_parser import html_to_text_bs4, html_to_text_fast
+from bench.fakes import _html_body
+
+EDGE_CASES = [
+    '',
+    '   \n\t ',
+    '\ufeff<p>Byte order mark</p>',
+    'Plain text, no tags at all',
+    '<p>Tom &amp; Jerry &lt;3 &quot;cheese&quot; &#169; &#x2603; &nbsp;&nbsp;&euro;5</p>',
+    '<p>Unknown &bogus; entity and a bare & ampersand</p>',
+    '<table><tr><td>Outer<table><tr><td>Inner 1</td><td>Inner 2</td></tr></table></td></tr></table>',
+    '<p>One<br>Two<br/>Three<br />Four</p><p>Five</p>',
+    '<ul><li>First</li><li>Second<ol><li>Nested</li></ol></li></ul>',
+    '<head><style>p {color: red}</style><script>if (a < b) { alert("x"); }</script></head><p>Body</p>',
+    '<p>Before<script type="text/template"><div>hidden</div></script>After</p>',
+    '<p>Kept<!-- a comment --> text<!-- multi\nline\ncomment --></p>',
+    '<p>Start<![CDATA[ cdata text ]]>end</p>',
+    '<pre>  indented\n    code\n\n  block  </pre><p>after</p>',
+    '<textarea>\n   \n</textarea><p>x</p>',
+    '<p>  Two  spaces  split  phrases  </p>',
+    '<div>\n\n   \n</div><div>   </div><span> </span>text',
+    '<p>Tabs\tand\x0bvertical\x0ctab and\rreturns</p>',
+    '<p>Unicode\u2028line\u2029separators\x85next</p>',
+    '<p>Unclosed <b>bold <i>italic</p><div>stray</span> close</div>',
+    '<p>Attribute <a href="x" title="<b>not a tag</b>">link</a> text</p>',
+    '<html><body><h1>Title</h1></body></html><p>After html</p>',
+    '<p>Greater > and less < signs</p>',
+    '<template><p>Template content</p></template><p>Visible</p>',
+    '<ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp>字</ruby>',
+    '<p>Emoji 😀 and accents éàü</p>',
+    '<!DOCTYPE html><?xml-stylesheet href="a"?><p>Processing instruction</p>',
+    '<p>Trailing whitespace </p>\n\n\n',
+]
+
+# Building blocks for random documents
+_TAGS = ['p', 'div', 'span', 'b', 'td', 'tr', 'table', 'li', 'ul', 'br', 'a', 'pre', 'h2', 'script', 'style']
+_TEXTS = ['Hello', 'world', '  ', ' ', '\n', '\t', '&amp;', '&nbsp;', '&lt;', '&#8212;', 'x  y',
+          'café', '\u2028', '<!-- c -->', '&', '<', '>']
+
+
+def random_document(rng, pieces=40):
+    """
+    Random tag soup: properly nested, unclosed and stray tags mixed with text and entities
+    """
+    out = []
+    open_tags = []
+    for _ in range(pieces):
+        roll = rng.random()
+        if roll < 0.35:
+            tag = rng.choice(_TAGS)
+            out.append(f'<{tag}>')
+            if tag != 'br':
+                open_tags.append(tag)
+        elif roll < 0.55 and open_tags:
+            out.append(f'</{open_tags.pop()}>')
+        elif roll < 0.6:
+            out.append(f'</{rng.choice(_TAGS)}>')
+        else:
+            out.append(rng.choice(_TEXTS))
+    return ''.join(out)
+
+
+def build_corpus(bodies, random_docs, corpus_dir=None, seed=1):
+    """
+    Returns: list of (name, html) pairs
+    """
+    rng = random.Random(seed)
+    corpus = [(f'edge{i}', html) for i, html in enumerate(EDGE_CASES)]
+    corpus += [(f'mailbox{i}', _html_body(rng, rows=rng.choice([1, 10, 100, 400]))) for i in range(bodies)]
+    corpus += [(f'random{i}', random_document(rng, rng.randint(1, 80))) for i in range(random_docs)]
+    
+    if corpus_dir:
+        for name in sorted(os.listdir(corpus_dir)):
+            path = os.path.join(corpus_dir, name)
+            if os.path.isfile(path):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    corpus.append((name, f.read()))
+    return corpus
+
+
+def first_difference(fast, slow):
+    """
+    Describe the first line where the two conversions differ
+    """
+    fast_lines, slow_lines = fast.split('\n'), slow.split('\n')
+    for i, (a, b) in enumerate(zip(fast_lines, slow_lines)):
+        if a != b:
+            return f"line {i + 1}: fast {a!r} vs bs4 {b!r}"
+    return f"fast has {len(fast_lines)} line(s), bs4 has {len(slow_lines)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check html_to_text_fast against html_to_text_bs4')
+    parser.add_argument('--bodies', type=int, default=50, help='synthetic mailbox HTML bodies')
+    parser.add_argument('--random', type=int, default=1000, help='random tag-soup documents')
+    parser.add_argument('--corpus-dir', help='directory of extra .html files to check')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    corpus = build_corpus(args.bodies, args.random, args.corpus_dir, args.seed)
+    
+    problems = []
+    fast_seconds = slow_seconds = 0.0
+    for name, html in corpus:
+        # html_to_text_bs4 prints and returns the input on errors; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fast = html_to_text_fast(html)
+            fast_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            slow = html_to_text_bs4(html)
+            slow_seconds += time.perf_counter() - start
+        if fast != slow:
+            problems.append(f"{name}: {first_difference(fast, slow)}")
+    
+    print(f"Documents checked: {len(corpus)} ({len(EDGE_CASES)} edge cases, {args.bodies} mailbox bodies, "
+          f"{args.random} random)")
+    print(f"Conversion time: {slow_seconds:.2f}s with bs4, {fast_seconds:.2f}s fast "
+          f"({slow_seconds / max(fast_seconds, 1e-9):.1f}x)")
+    
+    if problems:
+        print(f"\n{len(problems)} problem(s):")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("OK: html_to_text_fast matches html_to_text_bs4")
+
+
+if __name__ == '__main__':
+    main()
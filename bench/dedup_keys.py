@@ -0,0 +1,115 @@
+"""
+Dedup key benchmark - memory and lookup time of the duplicate-check key set
+
+Compares the original set of (From, Subject, Date) tuples with KeyHashSet
+(64-bit hashes in a sorted array) for a sheet of --rows logged emails.
+
+Usage:
+    python bench/dedup_keys.py --rows 1000000
+    python bench/dedup_keys.py --rows 1000000 --json dedup.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.dedup_keys import KeyHashSet
+
+
+def sheet_rows(count, seed=1):
+    """
+    Rows as values.get returns them for columns A:C (fresh strings, like a parsed API response)
+    """
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        sender = rng.randrange(500)
+        rows.append([
+            f'Sender {sender} <sender{sender}@example.com>',
+            f'Weekly report for project {rng.randrange(10000)} #{index}',
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1600000000 + index * 61))
+        ])
+    return rows
+
+
+def build_tuple_set(rows):
+    return {(row[0], row[1], row[2]) for row in rows}
+
+
+def build_hash_set(rows):
+    return KeyHashSet((row[0], row[1], row[2]) for row in rows)
+
+
+def measure(build, count, lookups):
+    """
+    Build one key set from count sheet rows and time lookups against it
+    Returns: dict with retained MB, build seconds and microseconds per lookup (hit and miss)
+    """
+    # Memory pass: everything the set keeps alive once the API response is gone
+    gc.collect()
+    tracemalloc.start()
+    rows = sheet_rows(count)
+    keys = build(rows)
+    del rows
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keys
+
+    # Timing pass, without tracemalloc overhead
+    rows = sheet_rows(count)
+    start = time.perf_counter()
+    keys = build(rows)
+    build_seconds = time.perf_counter() - start
+
+    hits = [tuple(row) for row in random.Random(2).sample(rows, min(lookups, count))]
+    misses = [(row[0], row[1], row[2] + ' ') for row in hits]
+    del rows
+
+    start = time.perf_counter()
+    found = sum(1 for key in hits if key in keys)
+    hit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found_missing = sum(1 for key in misses if key in keys)
+    miss_seconds = time.perf_counter() - start
+    assert found == len(hits) and found_missing == 0
+
+    return {
+        'retained_mb': round(retained / 1e6, 1),
+        'bytes_per_key': round(retained / count, 1),
+        'build_seconds': round(build_seconds, 3),
+        'hit_us': round(hit_seconds / len(hits) * 1e6, 3),
+        'miss_us': round(miss_seconds / len(misses) * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory and lookup time of dedup key sets')
+    parser.add_argument('--rows', type=int, default=1000000, help='logged rows in the sheet')
+    parser.add_argument('--lookups', type=int, default=100000, help='lookups timed per set')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    report = {'rows': args.rows}
+    print(f"{'Key set':<12} {'Retained MB':>12} {'B/key':>8} {'Build s':>9} {'Hit us':>8} {'Miss us':>8}")
+    print("-" * 62)
+    for name, build in (('tuple set', build_tuple_set), ('KeyHashSet', build_hash_set)):
+        result = report[name] = measure(build, args.rows, args.lookups)
+        print(f"{name:<12} {result['retained_mb']:>12} {result['bytes_per_key']:>8} "
+              f"{result['build_seconds']:>9} {result['hit_us']:>8} {result['miss_us']:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
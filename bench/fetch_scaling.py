@@ -0,0 +1,126 @@
+"""
+Fetch scaling benchmark - get_unread_emails throughput by FETCH_WORKERS
+
+Serves a synthetic mailbox from a local HTTP stub server (real sockets, keep-alive,
+simulated per-request latency) and fetches it with 1, 2, 4, ... worker threads sharing
+one Gmail service built on the pooled transport (auth.HttpPool).
+
+Usage:
+    python bench/fetch_scaling.py --messages 400 --workers 1,2,4,8 --latency-ms 50
+    python bench/fetch_scaling.py --batch --messages 2000 --json scaling.json
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+from src.auth import HttpPool, get_discovery_doc
+from src.gmail_service import get_unread_emails
+from src.metrics import get_request_builder
+from bench.fakes import DEFAULT_MIX, FakeGmailHttp, build_mailbox, serve_fake
+from bench.run_benchmarks import parse_mix
+
+
+def build_stub_service(root_url):
+    """
+    Gmail service pointed at the stub server, on a pooled transport without credentials
+    """
+    doc = copy.deepcopy(get_discovery_doc('gmail', 'v1'))
+    # Batch requests go to rootUrl + batchPath, so point the whole document at the stub
+    doc['rootUrl'] = root_url
+    doc['baseUrl'] = root_url + doc['servicePath']
+    return build_from_document(doc, http=HttpPool(build_http), requestBuilder=get_request_builder())
+
+
+def run_stub_server(messages, latency, conn):
+    """
+    Stub server process: serve the mailbox until told to stop, then send back its counters
+    (a separate process, so the server's work does not compete with the client for the GIL)
+    """
+    fake = FakeGmailHttp(messages, latency)
+    server, root_url = serve_fake(fake)
+    conn.send(root_url)
+    conn.recv()
+    server.shutdown()
+    conn.send({'requests': fake.round_trips, 'connections': fake.calls.get('connection', 0)})
+
+
+def measure(messages, workers, latency):
+    """
+    Fetch every message of a fresh stub mailbox with the given number of workers
+    Returns: dict with seconds, messages per second, HTTP requests and connections opened
+    """
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=run_stub_server, args=(messages, latency, child_conn), daemon=True)
+    server.start()
+    try:
+        service = build_stub_service(conn.recv())
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetched = get_unread_emails(service, len(messages), workers=workers)
+        seconds = time.perf_counter() - start
+        service.close()
+        conn.send('stop')
+        counters = conn.recv()
+    finally:
+        server.join(timeout=10)
+    
+    if len(fetched) != len(messages):
+        raise RuntimeError(f"{workers} worker(s) fetched {len(fetched)} of {len(messages)} messages")
+    return dict({
+        'workers': workers,
+        'seconds': round(seconds, 3),
+        'messages_per_second': round(len(fetched) / seconds, 1),
+    }, **counters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='get_unread_emails throughput by worker count')
+    parser.add_argument('--messages', type=int, default=400, help='synthetic mailbox size')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='message mix, e.g. plain=40,nested=30,html=20,duplicate=10')
+    parser.add_argument('--workers', default='1,2,4,8', help='comma-separated worker counts')
+    parser.add_argument('--latency-ms', type=float, default=50.0,
+                        help='simulated server time per HTTP request')
+    parser.add_argument('--batch', action='store_true',
+                        help='send Gmail batch requests (BATCH_SIZE calls each) instead of one call per message')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+    
+    # The stub enforces no quota, so time the transport rather than the rate limiter's waits
+    config.USE_RATE_LIMITER = False
+    config.USE_BATCH_FETCH = args.batch
+    messages, _ = build_mailbox(args.messages, args.mix)
+    
+    results = []
+    print(f"{args.messages} messages, {args.latency_ms:g} ms per request, "
+          f"{'batch requests' if args.batch else 'one messages.get per message'}")
+    print(f"{'Workers':>8} {'Seconds':>9} {'Msgs/s':>9} {'Speedup':>8} {'Requests':>9} {'Conns':>6}")
+    print("-" * 54)
+    for workers in (int(value) for value in args.workers.split(',')):
+        result = measure(messages, workers, args.latency_ms / 1000)
+        result['speedup'] = round(results[0]['seconds'] / result['seconds'], 2) if results else 1.0
+        results.append(result)
+        print(f"{workers:>8} {result['seconds']:>9} {result['messages_per_second']:>9} "
+              f"{result['speedup']:>8} {result['requests']:>9} {result['connections']:>6}")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'messages': args.messages, 'latency_ms': args.latency_ms,
+                       'batch': args.batch, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
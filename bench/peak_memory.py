@@ -0,0 +1,128 @@
+"""
+Peak memory benchmark - runs a full sync of a synthetic unread backlog against the local fakes
+
+Usage:
+    python bench/peak_memory.py --messages 10000
+    python bench/peak_memory.py --messages 10000 --json before.json
+    python bench/peak_memory.py --messages 10000 --baseline before.json
+
+Run one measurement per process: peak RSS is a high-water mark and cannot be reset.
+The fake mailbox lives in the same process, so the figure reported is how far RSS
+rose above its level just before the sync started.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import config
+from src.gmail_service import iter_unread_emails
+from src.state_store import open_state_store
+from src.dedup_keys import KeyHashSet
+from src.main import make_message_filter, sync_pages
+from bench.fakes import DEFAULT_MIX, build_mailbox
+from bench.run_benchmarks import build_fake_services, parse_mix
+
+
+def current_rss():
+    """
+    Resident set size of this process right now, in bytes
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    """
+    Highest resident set size of this process so far, in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_sync(size, mix, page_size):
+    """
+    Sync a synthetic backlog of size unread messages into a fake sheet
+    Returns: report dict
+    """
+    messages, logged_rows = build_mailbox(size, mix)
+    gmail_service, gmail_http, sheets_service, sheets_http = build_fake_services(messages, logged_rows)
+    del messages
+    # Appended rows are checked by count only; don't let the fake sheet hold every body
+    sheets_http.keep_content = False
+    
+    workdir = tempfile.mkdtemp(prefix='peak_memory_')
+    config.PAGE_SIZE = page_size
+    config.MAX_RESULTS = None
+    config.USE_PIPELINE = False
+    config.USE_INCREMENTAL_SYNC = False
+    config.METRICS_REPORT_FILE = None
+    state = open_state_store(
+        path=os.path.join(workdir, 'state.db'),
+        json_path=os.path.join(workdir, 'state.json')
+    )
+    existing_emails = KeyHashSet(tuple(row[:3]) for row in sheets_http.rows[1:])
+    
+    gc.collect()
+    rss_before = current_rss()
+    start = time.perf_counter()
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        message_filter = make_message_filter(gmail_service, state, existing_emails)
+        pages = iter_unread_emails(gmail_service, config.PAGE_SIZE, None, message_filter)
+        totals = sync_pages(pages, gmail_service, sheets_service, state, existing_emails)
+    
+    seconds = time.perf_counter() - start
+    state.close()
+    return {
+        'messages': size,
+        'page_size': page_size,
+        'rows_added': totals['rows_added'],
+        'seconds': round(seconds, 3),
+        'rss_before_mb': round(rss_before / 1e6, 1),
+        'peak_rss_growth_mb': round((peak_rss() - rss_before) / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of a full sync')
+    parser.add_argument('--messages', type=int, default=10000, help='synthetic backlog size')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='message mix, e.g. plain=40,nested=30,html=20,duplicate=10')
+    parser.add_argument('--page-size', type=int, default=500, help='PAGE_SIZE for the run')
+    parser.add_argument('--json', help='write the result to this file')
+    parser.add_argument('--baseline', help='compare against a previous --json result')
+    args = parser.parse_args()
+    
+    report = run_sync(args.messages, args.mix, args.page_size)
+    print(f"Messages: {report['messages']} (page size {report['page_size']}), "
+          f"rows added: {report['rows_added']}, {report['seconds']}s")
+    print(f"Peak RSS growth during sync: {report['peak_rss_growth_mb']} MB")
+    
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        change = report['peak_rss_growth_mb'] - baseline['peak_rss_growth_mb']
+        print(f"Baseline: {baseline['peak_rss_growth_mb']} MB ({change:+.1f} MB)")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Offline benchmark suite - times the functions a run uses for each stage against
+local Gmail/Sheets stand-ins
+
+Usage:
+    python bench/run_benchmarks.py --messages 1000 --mix plain=40,nested=30,html=20,duplicate=10
+    python bench/run_benchmarks.py --json bench_results.json
+    python bench/run_benchmarks.py --baseline bench_results.json --tolerance 0.25
+
+With --baseline, the run exits with status 1 if any stage got slower than
+the baseline by more than the tolerance, so it can gate CI.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from googleapiclient.discovery import build_from_document
+
+import config
+from src.auth import get_discovery_doc
+from src.gmail_service import get_unread_emails
+from src.email_parser import parse_email_records
+from src.dedup_index import get_existing_emails_indexed
+from src.partitions import append_records
+from bench.fakes import DEFAULT_MIX, build_mailbox, FakeGmailHttp, FakeSheetsHttp
+
+
+def build_fake_services(messages, sheet_rows, latency=0.0):
+    """
+    Build real Gmail and Sheets service objects wired to the local fakes
+    Returns: tuple (gmail_service, gmail_http, sheets_service, sheets_http)
+    """
+    # The fakes enforce no quota, so time the code rather than the rate limiter's waits
+    config.USE_RATE_LIMITER = False
+    gmail_http = FakeGmailHttp(messages, latency)
+    sheets_http = FakeSheetsHttp(sheet_rows, config.SHEET_HEADERS, latency)
+    gmail_service = build_from_document(get_discovery_doc('gmail', 'v1'), http=gmail_http)
+    sheets_service = build_from_document(get_discovery_doc('sheets', 'v4'), http=sheets_http)
+    return gmail_service, gmail_http, sheets_service, sheets_http
+
+
+def measure(name, func, *fakes):
+    """
+    Run func once, quietly, recording wall time, peak traced memory and API round trips
+    Returns: tuple (func result, stage report dict)
+    """
+    trips_before = sum(fake.round_trips for fake in fakes)
+    reset_peak = getattr(tracemalloc, 'reset_peak', None)
+    if reset_peak is not None:
+        reset_peak()
+    else:
+        # Python 3.8 has no reset_peak; restarting tracing also starts a new peak
+        tracemalloc.stop()
+        tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - base
+    report = {
+        'stage': name,
+        'seconds': round(seconds, 4),
+        'peak_mb': round(peak / 1e6, 2),
+        'api_round_trips': sum(fake.round_trips for fake in fakes) - trips_before,
+    }
+    return result, report
+
+
+def run_benchmarks(size, mix, history_rows, latency):
+    """
+    Run every stage against a fresh synthetic mailbox
+    Returns: list of stage report dicts
+    """
+    messages, logged_rows = build_mailbox(size, mix)
+    # Pad the sheet with older history so the duplicate check reads a realistic log
+    filler = [[f'old{i}@example.com', f'Old subject {i}', '2023-01-01 00:00:00', 'x' * 500]
+              for i in range(history_rows)]
+    gmail_service, gmail_http, sheets_service, sheets_http = build_fake_services(
+        messages, filler + logged_rows, latency
+    )
+    del messages
+    
+    reports = []
+    tracemalloc.start()
+    
+    fetched, report = measure(
+        'get_unread_emails',
+        lambda: get_unread_emails(gmail_service, size),
+        gmail_http
+    )
+    report['items'] = len(fetched)
+    reports.append(report)
+    
+    # parse_email_records empties fetched as it goes, like a run does with each page
+    records, report = measure(
+        'parse_email_records',
+        lambda: [record for record in parse_email_records(fetched) if record]
+    )
+    report['items'] = len(records)
+    reports.append(report)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = os.path.join(tmp_dir, 'dedup_index.json')
+        
+        # First run: no index yet, so the whole sheet is read
+        existing, report = measure(
+            'dedup_index_build',
+            lambda: get_existing_emails_indexed(
+                sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME, index_file
+            ),
+            sheets_http
+        )
+        report['items'] = len(existing)
+        reports.append(report)
+        
+        new_records = [record for record in records if record.key not in existing]
+        landed, report = measure(
+            'append_records',
+            lambda: append_records(sheets_service, new_records, existing),
+            sheets_http
+        )
+        report['items'] = len(landed)
+        reports.append(report)
+        
+        # Later runs: load the index and read only the rows appended since
+        existing, report = measure(
+            'dedup_index_load',
+            lambda: get_existing_emails_indexed(
+                sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME, index_file
+            ),
+            sheets_http
+        )
+        report['items'] = len(existing)
+        reports.append(report)
+    
+    tracemalloc.stop()
+    return reports
+
+
+def parse_mix(text):
+    """
+    Parse 'plain=40,nested=30,html=20,duplicate=10' into a dict
+    """
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        mix[kind.strip()] = int(weight)
+    return mix
+
+
+def compare_to_baseline(reports, baseline_file, tolerance):
+    """
+    Print stages slower than the baseline by more than tolerance
+    Returns: True if there is no regression
+    """
+    with open(baseline_file, 'r') as f:
+        baseline = {report['stage']: report for report in json.load(f)['stages']}
+    
+    ok = True
+    for report in reports:
+        previous = baseline.get(report['stage'])
+        if not previous or not previous['seconds']:
+            continue
+        change = report['seconds'] / previous['seconds'] - 1
+        if change > tolerance:
+            ok = False
+            print(f"REGRESSION: {report['stage']} took {report['seconds']}s "
+                  f"vs {previous['seconds']}s baseline ({change:+.0%})")
+    return ok
+
+
+def print_report(reports):
+    print(f"{'Stage':<24}{'Items':>8}{'Seconds':>10}{'Peak MB':>10}{'API calls':>11}")
+    print('-' * 63)
+    for report in reports:
+        print(f"{report['stage']:<24}{report['items']:>8}{report['seconds']:>10.3f}"
+              f"{report['peak_mb']:>10.2f}{report['api_round_trips']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline throughput benchmarks')
+    parser.add_argument('--messages', type=int, default=500, help='synthetic mailbox size')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='message mix, e.g. plain=40,nested=30,html=20,duplicate=10')
+    parser.add_argument('--history-rows', type=int, default=5000,
+                        help='older rows already in the sheet')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='simulated network latency per HTTP round trip')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against a previous --json result')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown vs baseline before failing (0.25 = 25%%)')
+    args = parser.parse_args()
+    
+    reports = run_benchmarks(args.messages, args.mix, args.history_rows, args.latency_ms / 1000)
+    print_report(reports)
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'messages': args.messages,
+                'mix': args.mix,
+                'history_rows': args.history_rows,
+                'latency_ms': args.latency_ms,
+                'stages': reports
+            }, f, indent=2)
+    
+    if args.baseline and not compare_to_baseline(reports, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,16 +12,124 @@ SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 CREDENTIALS_FILE = os.path.join('credentials', 'credentials.json')
 TOKEN_FILE = os.path.join('credentials', 'token.json')
 STATE_FILE = 'state.json'
+STATE_DB_FILE = 'state.db'
+DEDUP_INDEX_FILE = 'dedup_index.json'
 
 # Google Sheet configuration
 # You'll need to create a Google Sheet and paste its ID here
 SPREADSHEET_ID = '18aCaoZZ4hblyqy9lRiYJWiKOyXg35Z4yUci6cgqAUdg'
 
 SHEET_NAME = 'EmailLog'  # Name of the sheet tab
+APPEND_MAX_BYTES = 2000000  # Request body budget per values.append call (rows are split into chunks)
+APPEND_MAX_RETRIES = 5  # Retries for rate-limit/5xx errors per chunk
+BACKOFF_BASE = 1.0  # Seconds; backoff doubles per retry with random jitter
+BACKOFF_MAX = 32.0  # Upper bound for a single backoff sleep
+USE_DEDUP_INDEX = True  # Keep a local index of sheet rows and read only newly appended rows
+DEDUP_KEY = 'headers'  # 'headers' (From, Subject, Date) or 'message_id' (adds a Message-ID column E and keys on it)
+USE_OUTBOX = True  # Save parsed rows in the state store before appending; later runs retry them first
+SHEET_PARTITION = None  # None (one SHEET_NAME tab), 'month' (EmailLog_2024_05, ... by Date) or 'rows' (EmailLog_1, EmailLog_2, ...)
+# Rows already in SHEET_NAME when partitioning is turned on are kept there and still checked for duplicates
+PARTITION_MAX_ROWS = 200000  # Rows per tab with SHEET_PARTITION = 'rows'
+
+# State configuration
+STATE_BACKEND = 'sqlite'  # 'sqlite' (STATE_DB_FILE) or 'json' (original STATE_FILE format)
+STATE_RETENTION_DAYS = 365  # Forget processed IDs older than this (None = keep forever)
 
 # Email configuration
 MARK_AS_READ = True  # Mark emails as read after processing
-MAX_RESULTS = 100  # Maximum emails to fetch per run
+MODIFY_BATCH_SIZE = 1000  # Message IDs per messages.batchModify call (Gmail allows at most 1000)
+MODIFY_MAX_RETRIES = 5  # Retries for rate-limit/5xx errors per batchModify call (BACKOFF_BASE, BACKOFF_MAX)
+MAX_RESULTS = None  # Maximum emails to fetch per run (None = drain the whole backlog)
+PAGE_SIZE = 100  # Emails fetched and processed per page (messages.list allows at most 500)
+USE_INCREMENTAL_SYNC = True  # Use the Gmail History API checkpoint in the state file instead of a full query
+USE_BATCH_FETCH = True  # Fetch messages via Gmail batch requests instead of one call each
+BATCH_SIZE = 50  # messages.get calls per batch request (Gmail allows at most 100)
+METADATA_FIRST = True  # On full-query pages, fetch From/Subject/Date headers first and skip logged emails before downloading bodies
+FETCH_WORKERS = 1  # Threads sending a page's messages.get calls (or batches) in parallel (1 = one at a time)
+HTTP_POOL_SIZE = 8  # Idle keep-alive connections each service keeps for reuse by its threads
+
+# Partial-response field masks, one per API call site (None = full response)
+# The messages.get masks must keep everything email_parser reads: headers, each part's
+# mimeType and body data, nested parts (the innermost 'parts' keeps whole subtrees),
+# internalDate (message key fallback) and labelIds (incremental sync skips read mail)
+FIELD_MASKS = {
+    'gmail.messages.list': 'messages/id,nextPageToken',
+    'gmail.messages.get': (
+        'id,labelIds,internalDate,payload(mimeType,headers(name,value),body/data,'
+        'parts(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data,parts))))'
+    ),
+    'gmail.messages.get.metadata': 'id,internalDate,payload/headers(name,value)',
+    'gmail.messages.modify': 'id',
+    'gmail.history.list': 'history/messagesAdded/message(id,labelIds),historyId,nextPageToken',
+    'gmail.getProfile': 'historyId',
+    'sheets.values.get': 'values',
+    'sheets.values.batchGet': 'valueRanges.values',
+    'sheets.values.update': 'updatedRows',
+    'sheets.values.append': 'updates.updatedRows',
+    'sheets.spreadsheets.get': 'sheets.properties.title',
+    'sheets.spreadsheets.batchUpdate': 'spreadsheetId',
+}
+
+# Parsing configuration
+HTML_ENGINE = 'fast'  # 'fast' (streaming lxml) or 'bs4' (BeautifulSoup) for HTML-to-text
+MAX_CONTENT_CHARS = 50000  # Content is cut to this length (Sheets cell limit); decoding stops once reached
+PARSE_WORKERS = 1  # Worker processes for parsing (1 = serial)
+PARSE_CHUNK_SIZE = 16  # Messages sent to a worker process at a time
+PARSE_PARALLEL_MIN = 50  # Pages smaller than this are always parsed serially (keep it below PAGE_SIZE)
+PARSE_MAX_ATTEMPTS = 3  # Runs an email that fails to parse holds back the history checkpoint before it is skipped
+
+# Pipeline configuration (overlaps fetch, parse, append and mark-as-read)
+USE_PIPELINE = False  # Run the stages concurrently with asyncio instead of one page at a time
+PIPELINE_QUEUE_SIZE = 2  # Pages buffered between stages
+PIPELINE_PARSE_WORKERS = 2  # Pages parsed concurrently (uses PARSE_WORKERS processes each)
+PIPELINE_APPEND_WORKERS = 1  # Concurrent sheet appends
+PIPELINE_MARK_WORKERS = 1  # Concurrent mark-as-read calls
+
+# Daemon mode (python src/main.py --daemon)
+DAEMON_MIN_INTERVAL = 15  # Seconds between polls while mail is arriving
+DAEMON_MAX_INTERVAL = 600  # Longest wait between polls on a quiet mailbox
+DAEMON_BACKOFF_FACTOR = 2  # Interval multiplier after each quiet poll
+
+# Historical backfill (python src/main.py --backfill)
+# Logs every matching email, read or not, without changing any labels
+BACKFILL_QUERY = ''  # Gmail search query ('' = all mail except spam and trash, e.g. 'in:inbox')
+BACKFILL_AFTER = None  # Only emails on or after this date, 'YYYY-MM-DD' (None = no lower bound)
+BACKFILL_BEFORE = None  # Only emails before this date, 'YYYY-MM-DD' (None = no upper bound)
+BACKFILL_PAGE_SIZE = 500  # Emails listed per page; the checkpoint advances once a page is in the sheet
+BACKFILL_WORKERS = 4  # Threads fetching a page's emails in parallel over pooled Gmail connections
+BACKFILL_CHECKPOINT_FILE = 'backfill_checkpoint.json'  # Where an interrupted backfill resumes from
+
+# Multiple mailboxes (python src/main.py --all-mailboxes)
+# Each profile needs a 'name'; any other key overrides the config setting of the same name.
+# TOKEN_FILE, STATE_FILE, STATE_DB_FILE, DEDUP_INDEX_FILE, BACKFILL_CHECKPOINT_FILE and the metrics files
+# default to per-profile names.
+MAILBOX_PROFILES = [
+    # {
+    #     'name': 'support',
+    #     'SPREADSHEET_ID': 'SUPPORT_SPREADSHEET_ID',
+    #     'SHEET_NAME': 'EmailLog',
+    # },
+]
+MAX_CONCURRENT_MAILBOXES = 4  # Mailboxes processed at the same time
+MAILBOX_TIMEOUT = 1800  # Seconds before a mailbox's worker is stopped (None = no limit)
+MAILBOX_LOG_DIR = 'logs'  # Per-mailbox output goes to <MAILBOX_LOG_DIR>/<name>.log
+
+# Metrics (per-stage timings, API calls and Gmail quota units for each run)
+METRICS_REPORT_FILE = 'run_report.json'  # JSON report of the last run (None = don't write)
+METRICS_PROMETHEUS_FILE = None  # e.g. node_exporter textfile collector path ending in .prom
+GMAIL_QUOTA_UNITS_PER_SECOND = 250  # Gmail per-user quota, shown next to the run's peak usage
+SHEETS_QUOTA_CALLS_PER_MINUTE = 60  # Sheets per-user request quota
+
+# Rate limiting (token buckets shared by every thread in the process, pipeline stages included)
+# Each call waits until its quota cost fits the budget instead of running into 429 errors
+USE_RATE_LIMITER = True
+# bucket: (budget, seconds) - at most budget tokens per that many seconds, also the largest burst
+# (None = no limit). Gmail calls cost their quota units, Sheets calls cost 1 read or write request
+RATE_LIMITS = {
+    'gmail': (250, 1),  # Gmail quota units per user per second
+    'sheets.read': (60, 60),  # Sheets read requests per user per minute
+    'sheets.write': (60, 60),  # Sheets write requests per user per minute
+}
 
 # Column headers for the sheet
 SHEET_HEADERS = ['From', 'Subject', 'Date', 'Content']
\ No newline at end of file
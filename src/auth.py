@@ -0,0 +1,173 @@
+"""
+Auth module - shared OAuth credentials and service construction for Gmail and Sheets
+"""
+
+import json
+import os
+import threading
+
+import config
+
+# Credentials shared by every service built in this process
+_credentials = None
+_credentials_lock = threading.Lock()
+
+# Parsed discovery documents, keyed by (api name, version)
+_discovery_docs = {}
+
+
+def load_credentials():
+    """
+    Load credentials from token.json, refreshing or running the OAuth flow if needed
+    token.json is only rewritten when the credentials changed
+    Returns: Credentials object
+    """
+    # Imported here so runs that never need them don't pay for loading them
+    from google.oauth2.credentials import Credentials
+    
+    creds = None
+    
+    # Combine all scopes (Gmail + Sheets) for single authentication
+    ALL_SCOPES = config.GMAIL_SCOPES + config.SHEETS_SCOPES
+    
+    # Token file stores the user's access and refresh tokens
+    if os.path.exists(config.TOKEN_FILE):
+        try:
+            creds = Credentials.from_authorized_user_file(config.TOKEN_FILE, ALL_SCOPES)
+        except Exception as e:
+            print(f"Error loading credentials: {e}")
+            creds = None
+    
+    # If no valid credentials, let user log in
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            try:
+                from google.auth.transport.requests import Request
+                
+                print("Refreshing access token...")
+                creds.refresh(Request())
+            except Exception as e:
+                print(f"Error refreshing token: {e}")
+                creds = None
+        
+        if not creds:
+            if not os.path.exists(config.CREDENTIALS_FILE):
+                raise FileNotFoundError(
+                    f"Credentials file not found at {config.CREDENTIALS_FILE}\n"
+                    "Please download credentials.json from Google Cloud Console"
+                )
+            
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            
+            print("Starting OAuth 2.0 flow for Gmail AND Sheets...")
+            flow = InstalledAppFlow.from_client_secrets_file(
+                config.CREDENTIALS_FILE,
+                ALL_SCOPES  # Request both Gmail and Sheets scopes
+            )
+            creds = flow.run_local_server(port=0)
+            print("Authentication successful!")
+        
+        # Save credentials for future runs
+        with open(config.TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+    
+    return creds
+
+
+def get_credentials():
+    """
+    Get the process-wide credentials, loading them on first use
+    Later token refreshes are handled by the authorized HTTP transport
+    Returns: Credentials object
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = load_credentials()
+        return _credentials
+
+
+def get_discovery_doc(api, version):
+    """
+    Get the parsed discovery document bundled with google-api-python-client
+    Returns: dict, or None if no static document is available
+    """
+    key = (api, version)
+    if key not in _discovery_docs:
+        from googleapiclient.discovery_cache import get_static_doc
+        
+        content = get_static_doc(api, version)
+        _discovery_docs[key] = json.loads(content) if content else None
+    return _discovery_docs[key]
+
+
+class HttpPool:
+    """
+    Thread-safe HTTP transport for API service objects
+    httplib2.Http is not thread-safe, so each request checks an Http out of the pool (creating
+    one if none is idle) and returns it afterwards; its keep-alive connection is reused by
+    the next request from any thread. A service built on it can be shared by worker threads
+    """
+    
+    def __init__(self, factory, credentials=None, max_idle=None):
+        self.factory = factory  # Function returning a new (authorized) Http
+        self.credentials = credentials  # Read by batch requests to authorize their parts
+        self.max_idle = config.HTTP_POOL_SIZE if max_idle is None else max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def request(self, *args, **kwargs):
+        with self.lock:
+            http = self.idle.pop() if self.idle else None
+        if http is None:
+            http = self.factory()
+        
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            with self.lock:
+                if len(self.idle) < self.max_idle:
+                    self.idle.append(http)
+                    http = None
+            if http is not None:
+                http.close()
+    
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for http in idle:
+            http.close()
+
+
+def authorized_http_pool(credentials):
+    """
+    Pool of Http objects that authorize requests with credentials (and refresh the token)
+    Returns: HttpPool
+    """
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http
+    
+    return HttpPool(lambda: AuthorizedHttp(credentials, http=build_http()), credentials)
+
+
+def build_service(api, version, credentials=None):
+    """
+    Build an API service object from the cached discovery document
+    Every call returns a new service with its own pool of keep-alive connections,
+    so it can be used from several threads at once
+    Returns: API service object
+    """
+    from googleapiclient.discovery import build, build_from_document
+    from src.metrics import get_request_builder
+    
+    if credentials is None:
+        credentials = get_credentials()
+    http = authorized_http_pool(credentials)
+    
+    # Every executed request is recorded by the metrics module
+    request_builder = get_request_builder()
+    
+    doc = get_discovery_doc(api, version)
+    if doc is None:
+        return build(api, version, http=http, cache_discovery=False, requestBuilder=request_builder)
+    return build_from_document(doc, http=http, requestBuilder=request_builder)
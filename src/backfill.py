@@ -0,0 +1,290 @@
+"""
+Backfill module - logs a mailbox's history (read mail included) to the sheet page by page,
+saving a checkpoint after each page so an interrupted backfill resumes where it stopped
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+from src.gmail_service import (
+    authenticate_gmail,
+    fetch_full_messages,
+    fetch_message_metadata,
+    list_message_page
+)
+from src.sheets_service import authenticate_sheets, initialize_sheet
+from src.email_parser import parse_email_records, get_dedup_key
+from src.partitions import append_records
+from src.main import load_existing_emails
+from src import metrics
+
+
+def build_backfill_query(query=None, after=None, before=None):
+    """
+    Gmail search query for the backfill window
+    after, before: 'YYYY-MM-DD' dates (default BACKFILL_AFTER and BACKFILL_BEFORE)
+    Returns: query string, e.g. 'in:inbox after:2023/01/01 before:2024/01/01'
+    Raises: ValueError for a date that is not YYYY-MM-DD
+    """
+    if query is None:
+        query = config.BACKFILL_QUERY
+    if after is None:
+        after = config.BACKFILL_AFTER
+    if before is None:
+        before = config.BACKFILL_BEFORE
+    
+    terms = [query.strip()] if query and query.strip() else []
+    for operator, date in (('after', after), ('before', before)):
+        if date:
+            terms.append(f"{operator}:{datetime.strptime(date, '%Y-%m-%d').strftime('%Y/%m/%d')}")
+    return ' '.join(terms)
+
+
+def load_checkpoint(checkpoint_file=None):
+    """
+    Load the backfill checkpoint from disk
+    Returns: dict with query, spreadsheet_id, sheet_name, page_token, pages, found,
+             rows_added and done, or None
+    """
+    if checkpoint_file is None:
+        checkpoint_file = config.BACKFILL_CHECKPOINT_FILE
+    if not os.path.exists(checkpoint_file):
+        return None
+    
+    try:
+        with open(checkpoint_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading backfill checkpoint: {e}")
+        return None
+
+
+def save_checkpoint(checkpoint, checkpoint_file=None):
+    """
+    Save the backfill checkpoint to disk
+    Written to a temporary file and renamed, so an interrupted save leaves the previous checkpoint
+    """
+    if checkpoint_file is None:
+        checkpoint_file = config.BACKFILL_CHECKPOINT_FILE
+    checkpoint['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    tmp_file = f'{checkpoint_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def fetch_chunk(service, messages, existing_emails):
+    """
+    Fetch worker: drop emails already in the sheet (checked on their headers first, with
+    METADATA_FIRST) and download the rest in full
+    service is shared by the workers; its pooled transport gives each request its own connection
+    Returns: tuple (full messages, number of emails that could not be fetched)
+    """
+    if config.METADATA_FIRST and messages:
+        # An email whose headers could not be fetched is downloaded in full and checked after parsing
+        logged = {
+            msg['id'] for msg in fetch_message_metadata(service, messages, workers=1)
+            if get_dedup_key(msg) in existing_emails
+        }
+        messages = [msg for msg in messages if msg['id'] not in logged]
+    
+    full_messages = fetch_full_messages(service, messages, workers=1)
+    return full_messages, len(messages) - len(full_messages)
+
+
+def fetch_page(executor, workers, service, messages, existing_emails):
+    """
+    Split one page of message stubs between the fetch workers
+    Returns: tuple (full messages in page order, number of emails that could not be fetched)
+    """
+    size = max(1, -(-len(messages) // workers))
+    chunks = [messages[start:start + size] for start in range(0, len(messages), size)]
+    
+    def fetch(chunk):
+        return fetch_chunk(service, chunk, existing_emails)
+    
+    full_messages = []
+    missing = 0
+    for chunk_messages, chunk_missing in executor.map(fetch, chunks):
+        full_messages.extend(chunk_messages)
+        missing += chunk_missing
+    return full_messages, missing
+
+
+def backfill_page(messages, sheets_service, existing_emails):
+    """
+    Parse one page of fetched messages and append the ones not already in the sheet
+    Returns: tuple (rows to add, rows added to sheet)
+    """
+    with metrics.stage('parse'):
+        records = []
+        for record in parse_email_records(messages):
+            if record and record.key not in existing_emails:
+                records.append(record)
+        metrics.count_items('parse', len(records))
+    
+    if not records:
+        return 0, 0
+    
+    with metrics.stage('append'):
+        landed = append_records(sheets_service, records, existing_emails)
+        metrics.count_items('append', len(landed))
+    # Later pages are checked against the rows we just wrote
+    existing_emails.update(record.key for record in landed)
+    return len(records), len(landed)
+
+
+def run_backfill(query=None, after=None, before=None, rebuild_index=False):
+    """
+    Log every email matching the backfill query to the sheet, read or unread, one page at a time
+    Resumes from BACKFILL_CHECKPOINT_FILE if it was saved for the same query and sheet.
+    The checkpoint advances only once all of a page's rows are in the sheet; rows of a page
+    that was interrupted part-way are skipped as duplicates when it is fetched again
+    Never marks emails as read or changes any other label, and leaves the sync state alone
+    Returns: dict of backfill totals, or None if the run stopped early
+    """
+    print("=" * 60)
+    print("Gmail to Google Sheets Backfill")
+    print("=" * 60)
+    print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    
+    # Check if spreadsheet ID is configured
+    if config.SPREADSHEET_ID == 'YOUR_SPREADSHEET_ID_HERE':
+        print("ERROR: Please set SPREADSHEET_ID in config.py")
+        print("Create a Google Sheet and copy its ID from the URL")
+        return
+    
+    try:
+        query = build_backfill_query(query, after, before)
+    except ValueError as e:
+        print(f"ERROR: Backfill dates must be YYYY-MM-DD ({e})")
+        return
+    print(f"Query: {query or '(all mail)'}")
+    
+    checkpoint = load_checkpoint()
+    if (not checkpoint or checkpoint.get('query') != query
+            or checkpoint.get('spreadsheet_id') != config.SPREADSHEET_ID
+            or checkpoint.get('sheet_name') != config.SHEET_NAME):
+        if checkpoint:
+            print("Checkpoint is for another query or sheet, starting a new backfill")
+        checkpoint = {
+            'query': query,
+            'spreadsheet_id': config.SPREADSHEET_ID,
+            'sheet_name': config.SHEET_NAME,
+            'page_token': None,
+            'pages': 0,
+            'found': 0,
+            'rows_added': 0,
+            'done': False
+        }
+    elif checkpoint['done']:
+        print(f"This backfill already finished ({checkpoint['rows_added']} row(s) added)")
+        print(f"Delete {config.BACKFILL_CHECKPOINT_FILE} to run it again")
+        return {'pages': 0, 'found': 0, 'rows_added': 0, 'complete': True}
+    else:
+        print(f"Resuming after page {checkpoint['pages']} "
+              f"({checkpoint['found']} email(s) listed, {checkpoint['rows_added']} row(s) added so far)")
+    
+    # Authenticate services
+    print("\n[Step 1] Authenticating with Google APIs...")
+    with metrics.stage('authenticate'):
+        gmail_service = authenticate_gmail()
+        sheets_service = authenticate_sheets()
+    
+    if not gmail_service or not sheets_service:
+        print("ERROR: Authentication failed")
+        return
+    
+    print("\n[Step 2] Initializing Google Sheet...")
+    if config.SHEET_PARTITION:
+        print(f"Partitioned by {config.SHEET_PARTITION}: tabs are created and initialized as rows arrive")
+        existing_emails = load_existing_emails(sheets_service, rebuild_index)
+    else:
+        with metrics.stage('initialize_sheet'):
+            initialize_sheet(sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME)
+        
+        print("\n[Step 3] Checking for existing emails in sheet...")
+        with metrics.stage('load_existing'):
+            existing_emails = load_existing_emails(sheets_service, rebuild_index)
+            metrics.count_items('load_existing', len(existing_emails))
+    
+    print(f"\n[Step 4] Backfilling with {config.BACKFILL_WORKERS} fetch worker(s)...")
+    workers = max(1, config.BACKFILL_WORKERS)
+    totals = {'pages': 0, 'found': 0, 'rows_added': 0, 'complete': False}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            with metrics.stage('fetch'):
+                results = list_message_page(
+                    gmail_service,
+                    query,
+                    config.BACKFILL_PAGE_SIZE,
+                    checkpoint['page_token']
+                )
+                if results is None:
+                    break
+                
+                messages = results.get('messages', [])
+                print(f"\n[Page {checkpoint['pages'] + 1}] {len(messages)} email(s)")
+                full_messages, missing = fetch_page(executor, workers, gmail_service, messages, existing_emails)
+                metrics.count_items('fetch', len(full_messages))
+            
+            if missing:
+                print(f"\nERROR: {missing} email(s) could not be fetched; "
+                      "the next run starts again from this page")
+                break
+            
+            rows, rows_added = backfill_page(full_messages, sheets_service, existing_emails)
+            print(f"\nAdded {rows_added} row(s) ({len(messages) - rows} already in the sheet or unparseable)")
+            totals['pages'] += 1
+            totals['found'] += len(messages)
+            totals['rows_added'] += rows_added
+            if rows_added < rows:
+                print("ERROR: Some rows could not be appended; the next run starts again from this page")
+                break
+            
+            checkpoint['page_token'] = results.get('nextPageToken')
+            checkpoint['pages'] += 1
+            checkpoint['found'] += len(messages)
+            checkpoint['rows_added'] += rows_added
+            checkpoint['done'] = not checkpoint['page_token']
+            save_checkpoint(checkpoint)
+            
+            if checkpoint['done']:
+                totals['complete'] = True
+                break
+    
+    # Summary
+    print("\n" + "=" * 60)
+    print("BACKFILL SUMMARY")
+    print("=" * 60)
+    print(f"Pages this run: {totals['pages']}")
+    print(f"Emails listed this run: {totals['found']}")
+    print(f"Rows added this run: {totals['rows_added']}")
+    print(f"Rows added (whole backfill): {checkpoint['rows_added']}")
+    if totals['complete']:
+        print("Backfill complete")
+    else:
+        print(f"Not finished: run --backfill again to resume from {config.BACKFILL_CHECKPOINT_FILE}")
+    print(f"Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 60)
+    return totals
+
+
+def main(query=None, after=None, before=None, rebuild_index=False):
+    """
+    Run the backfill, recording per-stage metrics like a regular run
+    """
+    metrics.reset()
+    totals = None
+    try:
+        totals = run_backfill(query, after, before, rebuild_index)
+    finally:
+        report = metrics.write_reports(totals)
+    
+    if totals and totals['found']:
+        print("\nSTAGES")
+        metrics.print_stage_summary(report)
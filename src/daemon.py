@@ -0,0 +1,131 @@
+"""
+Daemon module - long-running watch mode with adaptive polling
+"""
+
+import signal
+import threading
+from datetime import datetime
+
+import config
+from src.gmail_service import authenticate_gmail
+from src.sheets_service import authenticate_sheets, initialize_sheet
+from src.state_store import open_state_store, prune_if_due
+from src import metrics
+from src.main import (
+    make_message_filter,
+    get_message_pages,
+    load_existing_emails,
+    sync_pages
+)
+
+
+def next_poll_interval(interval, found):
+    """
+    Adapt the polling interval to mailbox activity
+    New mail resets the interval to DAEMON_MIN_INTERVAL; each quiet poll
+    multiplies it by DAEMON_BACKOFF_FACTOR, up to DAEMON_MAX_INTERVAL
+    Returns: seconds to wait before the next poll
+    """
+    if found:
+        return config.DAEMON_MIN_INTERVAL
+    return min(interval * config.DAEMON_BACKOFF_FACTOR, config.DAEMON_MAX_INTERVAL)
+
+
+def poll_once(gmail_service, sheets_service, state, existing_emails, stop_event):
+    """
+    Run one sync cycle against the already authenticated services and in-memory dedup set
+    Returns: number of emails found
+    """
+    prune_if_due(state)
+    message_filter = make_message_filter(gmail_service, state, existing_emails)
+    failed = set()
+    with metrics.stage('history'):
+        pages, new_history_id = get_message_pages(gmail_service, state, message_filter, failed)
+    
+    if pages is None:
+        if new_history_id != state.get('history_id'):
+            state.set('history_id', new_history_id)
+        if not (config.USE_OUTBOX and state.outbox_count()):
+            return 0
+        # Nothing new in Gmail, but the outbox still has rows to write
+        pages = []
+    
+    totals = sync_pages(
+        pages,
+        gmail_service,
+        sheets_service,
+        state,
+        existing_emails,
+        new_history_id,
+        stop_event,
+        failed
+    )
+    if totals['found'] or totals['processed']:
+        print(f"Processed {totals['processed']} new email(s), added {totals['rows_added']} row(s)")
+    return totals['found']
+
+
+def run_daemon(rebuild_index=False):
+    """
+    Keep polling Gmail until SIGTERM or SIGINT
+    Services, credentials, the state store and the dedup set stay in memory between polls.
+    On a shutdown signal the page in progress is finished (rows appended, emails marked
+    read, state saved) before the loop exits
+    The metrics report is rewritten after every poll and covers that poll only
+    (the first one also includes start-up)
+    """
+    print("=" * 60)
+    print("Gmail to Google Sheets Automation (daemon mode)")
+    print("=" * 60)
+    print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    
+    stop_event = threading.Event()
+    
+    def request_stop(signum, frame):
+        print(f"\nReceived signal {signum}, finishing current work before shutting down...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    metrics.reset()
+    state = open_state_store()
+    
+    with metrics.stage('authenticate'):
+        gmail_service = authenticate_gmail()
+        sheets_service = authenticate_sheets()
+    if not gmail_service or not sheets_service:
+        print("ERROR: Authentication failed")
+        state.close()
+        return
+    
+    # Done once per daemon instead of once per poll
+    if config.SHEET_PARTITION:
+        # Partition tabs are created and read as emails for them arrive
+        existing_emails = load_existing_emails(sheets_service, rebuild_index)
+    else:
+        with metrics.stage('initialize_sheet'):
+            initialize_sheet(sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME)
+        with metrics.stage('load_existing'):
+            existing_emails = load_existing_emails(sheets_service, rebuild_index)
+            metrics.count_items('load_existing', len(existing_emails))
+    
+    interval = config.DAEMON_MIN_INTERVAL
+    while not stop_event.is_set():
+        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Polling Gmail...")
+        try:
+            found = poll_once(gmail_service, sheets_service, state, existing_emails, stop_event)
+        except Exception as e:
+            print(f"ERROR during poll: {e}")
+            found = 0
+        
+        metrics.write_reports({'found': found})
+        metrics.reset()
+        
+        interval = next_poll_interval(interval, found)
+        if not stop_event.is_set():
+            print(f"Next poll in {interval:.0f}s")
+            stop_event.wait(interval)
+    
+    state.close()
+    print("Daemon stopped")
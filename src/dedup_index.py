@@ -0,0 +1,84 @@
+"""
+Dedup index module - keeps a local copy of the sheet's duplicate-check keys
+so each run only reads rows appended since the last run
+"""
+
+import base64
+import json
+import os
+
+import config
+from src.dedup_keys import KeyHashSet
+from src.sheets_service import get_email_keys, row_to_key
+
+
+def load_index(index_file):
+    """
+    Load the dedup index from disk
+    Returns: dict with spreadsheet_id, sheet_name, dedup_key, last_row and hashes, or None
+    """
+    if not os.path.exists(index_file):
+        return None
+    
+    try:
+        with open(index_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading dedup index: {e}")
+        return None
+
+
+def save_index(index, index_file):
+    """
+    Save the dedup index to disk
+    """
+    try:
+        with open(index_file, 'w') as f:
+            json.dump(index, f)
+    except Exception as e:
+        print(f"Error saving dedup index: {e}")
+
+
+def get_existing_emails_indexed(service, spreadsheet_id, sheet_name, index_file=None, rebuild=False):
+    """
+    Get the duplicate-check keys already in the sheet
+    Reads only rows appended after the index's last_row, then persists the index
+    Keys are stored as their 64-bit hashes (base64 of the sorted array)
+    rebuild: ignore the stored index and re-read the whole sheet (use after hand edits)
+    Returns: KeyHashSet of (from, subject, date) keys (with message keys, if logged)
+    """
+    if index_file is None:
+        index_file = config.DEDUP_INDEX_FILE
+    
+    index = None if rebuild else load_index(index_file)
+    
+    # Indexes written before keys were hashed (or for another DEDUP_KEY) are rebuilt
+    if (not index or index.get('spreadsheet_id') != spreadsheet_id
+            or index.get('sheet_name') != sheet_name
+            or index.get('dedup_key') != config.DEDUP_KEY
+            or 'hashes' not in index):
+        print("Building dedup index from the full sheet...")
+        index = {
+            'spreadsheet_id': spreadsheet_id,
+            'sheet_name': sheet_name,
+            'dedup_key': config.DEDUP_KEY,
+            'last_row': 1,  # Header row
+            'hashes': ''
+        }
+    
+    existing = KeyHashSet.from_bytes(base64.b64decode(index['hashes']))
+    start_row = index['last_row'] + 1
+    values = get_email_keys(service, spreadsheet_id, sheet_name, start_row)
+    if values is None:
+        # Fall back to what we already know rather than dropping the duplicate check
+        return existing
+    
+    existing.update(key for key in map(row_to_key, values) if key)
+    index['last_row'] += len(values)
+    print(f"Found {len(existing)} existing email(s) in sheet ({len(values)} new row(s) indexed)")
+    
+    if values or rebuild:
+        index['hashes'] = base64.b64encode(existing.to_bytes()).decode('ascii')
+        save_index(index, index_file)
+    
+    return existing
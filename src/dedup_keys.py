@@ -0,0 +1,123 @@
+"""
+Dedup keys module - stores duplicate-check keys as 64-bit hashes in an array-backed set
+"""
+
+import hashlib
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import chain, groupby
+
+# Separates the fields of a key before hashing
+_SEP = '\x1f'
+
+
+def hash_text(text):
+    """
+    Stable 64-bit hash of a string (the same in every process and Python version)
+    Returns: int
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def headers_hash(key):
+    """
+    Hash of a key's (From, Subject, Date) fields
+    """
+    return hash_text(_SEP.join(key[:3]))
+
+
+def key_hash(key):
+    """
+    Hash a key is stored under
+    key: (From, Subject, Date), or (From, Subject, Date, message key) with DEDUP_KEY = 'message_id'
+    Returns: int
+    """
+    if len(key) > 3 and key[3]:
+        return hash_text('id' + _SEP + key[3])
+    return headers_hash(key)
+
+
+class KeyHashSet:
+    """
+    Set of duplicate-check keys kept as 64-bit hashes: a sorted array('Q') plus a small set
+    of recent additions that is merged into the array once it grows
+    Takes about 8 bytes per key, where a tuple of three strings takes a few hundred
+    A key with a message key also matches a row logged before the Message-ID column existed
+    (stored under its (From, Subject, Date) hash)
+    """
+    
+    # Recent additions are merged once there are this many, or as many as in the array
+    MERGE_MIN = 4096
+    
+    def __init__(self, keys=()):
+        self.hashes = array('Q')
+        self.recent = set()
+        self.update(keys)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuild a set saved with to_bytes()
+        """
+        keys = cls()
+        keys.hashes.frombytes(data)
+        if sys.byteorder == 'big':
+            keys.hashes.byteswap()
+        return keys
+    
+    def to_bytes(self):
+        """
+        Returns: the sorted hashes as little-endian bytes
+        """
+        self._merge()
+        if sys.byteorder == 'big':
+            hashes = array('Q', self.hashes)
+            hashes.byteswap()
+            return hashes.tobytes()
+        return self.hashes.tobytes()
+    
+    def _merge(self, hashes=None):
+        if hashes is None:
+            if not self.recent:
+                return
+            hashes = sorted(self.recent)
+            self.recent = set()
+        # Both runs are already sorted, so this is close to a linear merge
+        merged = sorted(chain(self.hashes, hashes))
+        self.hashes = array('Q', (value for value, _ in groupby(merged)))
+    
+    def _has(self, value):
+        if value in self.recent:
+            return True
+        i = bisect_left(self.hashes, value)
+        return i < len(self.hashes) and self.hashes[i] == value
+    
+    def __contains__(self, key):
+        if self._has(key_hash(key)):
+            return True
+        return len(key) > 3 and self._has(headers_hash(key))
+    
+    def __len__(self):
+        # Approximate until the next merge: a recent hash may also be in the array
+        return len(self.hashes) + len(self.recent)
+    
+    def add(self, key):
+        self.update((key,))
+    
+    def update(self, keys):
+        if isinstance(keys, KeyHashSet):
+            keys._merge()
+            self._merge(keys.hashes)
+            return
+        
+        # Hashes already in the array are dropped when the recent ones are merged in
+        limit = max(self.MERGE_MIN, len(self.hashes))
+        for key in keys:
+            self.recent.add(key_hash(key))
+            if len(self.recent) >= limit:
+                self._merge()
+                limit = max(self.MERGE_MIN, len(self.hashes))
+        # A bulk load ends compact; a few keys added per page wait for the next merge
+        if len(self.recent) >= self.MERGE_MIN:
+            self._merge()
@@ -3,10 +3,21 @@ Email parser module - extracts and cleans email data
 """
 
 import base64
+import codecs
 import email
-from bs4 import BeautifulSoup
+import hashlib
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+import config
+
+# Worker pool for parse_email_records, created on first parallel use and reused across pages
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
 
 def parse_email_date(date_string):
     """
@@ -35,10 +46,13 @@ def decode_base64(data):
         return ""
 
 
-def html_to_text(html_content):
+def html_to_text_bs4(html_content):
     """
-    Convert HTML content to plain text
+    Convert HTML content to plain text using BeautifulSoup
     """
+    # Imported on first use; the fast engine does not need it
+    from bs4 import BeautifulSoup
+    
     try:
         soup = BeautifulSoup(html_content, 'lxml')
         # Remove script and style elements
@@ -58,11 +72,213 @@ def html_to_text(html_content):
         return html_content
 
 
-def get_email_body(payload):
+# Line breaks recognised by str.splitlines(), plus the double space used to split phrases
+_PHRASE_BREAKS = re.compile('[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]|  ')
+
+# Whitespace-only strings made of these characters are collapsed, as BeautifulSoup does
+_ASCII_SPACES = frozenset('\x20\x0a\x09\x0c\x0d')
+
+# Text inside these tags is dropped (BeautifulSoup decomposes or excludes it from get_text)
+_SKIP_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+# Tags whose whitespace-only text is kept as-is
+_PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+
+
+class _TextCollector:
     """
-    Extract email body from payload (handles both plain text and HTML)
+    lxml parser target that collects visible text without building a tree
+    Mirrors the strings BeautifulSoup's get_text() would return
+    """
+    
+    def __init__(self):
+        self.parts = []
+        self.pending = []
+        self.skip_depth = 0
+        self.preserve_depth = 0
+    
+    def _flush(self):
+        if not self.pending:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        if self.skip_depth:
+            return
+        if not self.preserve_depth and all(c in _ASCII_SPACES for c in data):
+            data = '\n' if '\n' in data else ' '
+        self.parts.append(data)
+    
+    def start(self, tag, attrib, nsmap=None):
+        self._flush()
+        if tag in _SKIP_TAGS:
+            self.skip_depth += 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+    
+    def end(self, tag):
+        self._flush()
+        if tag in _SKIP_TAGS:
+            self.skip_depth -= 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth -= 1
+    
+    def data(self, data):
+        self.pending.append(data)
+    
+    def comment(self, text):
+        self._flush()
+    
+    def pi(self, target, data=None):
+        self._flush()
+    
+    def doctype(self, *args):
+        self._flush()
+    
+    def close(self):
+        self._flush()
+        return ''.join(self.parts)
+
+
+def html_to_text_fast(html_content):
+    """
+    Convert HTML content to plain text with a streaming lxml parser
+    Produces the same output as html_to_text_bs4 without building a document tree
+    """
+    if html_content.startswith('\ufeff'):
+        html_content = html_content[1:]
+    if not html_content.strip():
+        return ''
+    
+    from lxml import etree
+    
+    parser = etree.HTMLParser(target=_TextCollector(), strip_cdata=False, recover=True)
+    parser.feed(html_content)
+    text = parser.close()
+    
+    # Split into lines and phrases, strip each and drop the blank ones in a single pass
+    return '\n'.join(phrase for phrase in map(str.strip, _PHRASE_BREAKS.split(text)) if phrase)
+
+
+def html_to_text(html_content):
+    """
+    Convert HTML content to plain text
+    Uses the engine set in HTML_ENGINE, falling back to BeautifulSoup on malformed input
+    """
+    if config.HTML_ENGINE == 'fast':
+        try:
+            return html_to_text_fast(html_content)
+        except Exception as e:
+            print(f"Fast HTML conversion failed, falling back to BeautifulSoup: {e}")
+    return html_to_text_bs4(html_content)
+
+
+def iter_decode_base64(data, chunk_size):
+    """
+    Decode base64 encoded UTF-8 data a piece at a time
+    chunk_size: base64 characters per piece (rounded down to a multiple of 4)
+    Yields: decoded text pieces; raises on invalid base64 or UTF-8
+    """
+    chunk_size = max(4, chunk_size - chunk_size % 4)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for start in range(0, len(data), chunk_size):
+        end = start + chunk_size
+        yield decoder.decode(base64.urlsafe_b64decode(data[start:end]), final=end >= len(data))
+
+
+def _cut(text, max_chars):
+    """
+    Cut already stripped text to max_chars
+    Returns: tuple (text, whether it was cut)
+    """
+    if max_chars is not None and len(text) > max_chars:
+        return text[:max_chars], True
+    return text, False
+
+
+def _decode_chunk_size(max_chars):
+    # Enough base64 for max_chars + 1 ASCII characters in the first piece
+    return 4 * (max_chars // 3 + 2)
+
+
+def decode_text_bounded(data, max_chars):
+    """
+    Decode a text/plain body, stopping once it is known to be longer than max_chars
+    Returns: tuple (stripped text cut to max_chars, whether it was cut)
+    """
+    # Decoded text has at most as many characters as bytes, so short bodies can't need cutting
+    if max_chars is None or len(data) * 3 // 4 <= max_chars:
+        return _cut(decode_base64(data).strip(), max_chars)
+    
+    try:
+        text = ''
+        for piece in iter_decode_base64(data, _decode_chunk_size(max_chars)):
+            text += piece
+            stripped = text.lstrip()
+            # Longer than max_chars once a non-whitespace character lies past the limit
+            if len(stripped) > max_chars and stripped[max_chars:].strip():
+                return stripped[:max_chars], True
+        return _cut(text.strip(), max_chars)
+    except Exception as e:
+        print(f"Error decoding base64: {e}")
+        return "", False
+
+
+def html_to_text_bounded(data, max_chars):
     """
-    body = ""
+    Decode and convert a text/html body, stopping once the text is known to be longer than max_chars
+    Only the fast engine can stop early; otherwise (or on any error) the whole body is converted
+    Returns: tuple (text cut to max_chars, whether it was cut)
+    """
+    if max_chars is None or len(data) * 3 // 4 <= max_chars or config.HTML_ENGINE != 'fast':
+        return _cut(html_to_text(decode_base64(data)).strip(), max_chars)
+    
+    try:
+        from lxml import etree
+        
+        pieces = []
+        decoded = 0
+        next_attempt = 0
+        for piece in iter_decode_base64(data, _decode_chunk_size(max_chars)):
+            pieces.append(piece)
+            decoded += len(piece)
+            if decoded < next_attempt:
+                continue
+            # Re-convert the decoded prefix, doubling its size between attempts
+            next_attempt = 2 * decoded
+            
+            html = ''.join(pieces)
+            pieces = [html]
+            if html.startswith('\ufeff'):
+                html = html[1:]
+            # Cut just before the last tag so the parser sees complete text nodes
+            cut = html.rfind('<')
+            if cut <= 0 or not html[:cut].strip():
+                continue
+            
+            collector = _TextCollector()
+            parser = etree.HTMLParser(target=collector, strip_cdata=False, recover=True)
+            parser.feed(html[:cut])
+            parser.close()
+            
+            # Only the last text node depends on what follows the cut, so the text of the
+            # others is a prefix of the full conversion
+            phrases = _PHRASE_BREAKS.split(''.join(collector.parts[:-1]))
+            text = '\n'.join(phrase for phrase in map(str.strip, phrases) if phrase)
+            if len(text) > max_chars:
+                return text[:max_chars], True
+        
+        return _cut(html_to_text(''.join(pieces)).strip(), max_chars)
+    except Exception:
+        return _cut(html_to_text(decode_base64(data)).strip(), max_chars)
+
+
+def extract_body(payload, max_chars=None):
+    """
+    Find the body text of a payload (plain text preferred, HTML converted, nested multipart searched)
+    Decoding stops early once a body is known to be longer than max_chars (None = no limit)
+    Returns: tuple (stripped body cut to max_chars, whether it was cut)
+    """
+    body = ("", False)
     
     if 'parts' in payload:
         # Multi-part email
@@ -71,27 +287,110 @@ def get_email_body(payload):
             
             if mime_type == 'text/plain':
                 data = part.get('body', {}).get('data', '')
-                body = decode_base64(data)
+                body = decode_text_bounded(data, max_chars)
                 break  # Prefer plain text
             elif mime_type == 'text/html':
                 data = part.get('body', {}).get('data', '')
-                html_body = decode_base64(data)
-                body = html_to_text(html_body)
+                body = html_to_text_bounded(data, max_chars)
             elif mime_type.startswith('multipart/'):
                 # Recursive for nested parts
-                body = get_email_body(part)
-                if body:
+                body = extract_body(part, max_chars)
+                text, truncated = body
+                if text or truncated:
                     break
     else:
         # Single part email
         data = payload.get('body', {}).get('data', '')
-        body = decode_base64(data)
         
         # If it's HTML, convert to text
         if payload.get('mimeType', '') == 'text/html':
-            body = html_to_text(body)
+            body = html_to_text_bounded(data, max_chars)
+        else:
+            body = decode_text_bounded(data, max_chars)
     
-    return body.strip()
+    return body
+
+
+def get_email_body(payload, max_chars=None):
+    """
+    Extract email body from payload (handles both plain text and HTML)
+    max_chars: cut longer bodies to this many characters plus a "... [truncated]" marker
+    """
+    body, truncated = extract_body(payload, max_chars)
+    if truncated:
+        body += "... [truncated]"
+    return body
+
+
+def parse_headers(headers):
+    """
+    Extract the From, Subject and Date headers
+    Returns: dict with From, Subject, Date and an empty Content
+    """
+    email_data = {
+        'From': '',
+        'Subject': '',
+        'Date': '',
+        'Content': ''
+    }
+    
+    for header in headers:
+        name = header.get('name', '')
+        value = header.get('value', '')
+        
+        if name == 'From':
+            email_data['From'] = value
+        elif name == 'Subject':
+            email_data['Subject'] = value
+        elif name == 'Date':
+            email_data['Date'] = parse_email_date(value)
+    
+    return email_data
+
+
+def get_message_key(message):
+    """
+    Stable identity of a message: its RFC Message-ID header or, for messages without one,
+    a hash of the raw From, Subject and Date headers and Gmail's internalDate
+    Unlike the parsed Date it never depends on when the message was parsed
+    Returns: str
+    """
+    headers = {
+        header.get('name', '').lower(): header.get('value', '')
+        for header in message.get('payload', {}).get('headers', [])
+    }
+    message_id = headers.get('message-id', '').strip()
+    if message_id:
+        return message_id
+    
+    content = '\x1f'.join([
+        headers.get('from', ''),
+        headers.get('subject', ''),
+        headers.get('date', ''),
+        str(message.get('internalDate', ''))
+    ])
+    return 'sha1:' + hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def build_dedup_key(message, email_data):
+    """
+    Duplicate-check key of a message whose headers are already parsed into email_data
+    Returns: tuple (from, subject, date), plus the message key with DEDUP_KEY = 'message_id'
+    """
+    key = (email_data['From'], email_data['Subject'], email_data['Date'])
+    if config.DEDUP_KEY == 'message_id':
+        key += (get_message_key(message),)
+    return key
+
+
+def get_dedup_key(message):
+    """
+    Build the duplicate-check key from a message's headers
+    Works on both 'full' and 'metadata' format messages
+    Returns: tuple (from, subject, date), plus the message key with DEDUP_KEY = 'message_id'
+    """
+    email_data = parse_headers(message.get('payload', {}).get('headers', []))
+    return build_dedup_key(message, email_data)
 
 
 def parse_email(message):
@@ -101,36 +400,135 @@ def parse_email(message):
     """
     try:
         payload = message.get('payload', {})
-        headers = payload.get('headers', [])
         
         # Extract headers
-        email_data = {
-            'From': '',
-            'Subject': '',
-            'Date': '',
-            'Content': ''
-        }
-        
-        for header in headers:
-            name = header.get('name', '')
-            value = header.get('value', '')
-            
-            if name == 'From':
-                email_data['From'] = value
-            elif name == 'Subject':
-                email_data['Subject'] = value
-            elif name == 'Date':
-                email_data['Date'] = parse_email_date(value)
-        
-        # Extract body
-        email_data['Content'] = get_email_body(payload)
+        email_data = parse_headers(payload.get('headers', []))
         
-        # Truncate content if too long (Google Sheets cell limit)
-        if len(email_data['Content']) > 50000:
-            email_data['Content'] = email_data['Content'][:50000] + "... [truncated]"
+        # Extract body, truncated to MAX_CONTENT_CHARS (Google Sheets cell limit)
+        email_data['Content'] = get_email_body(payload, config.MAX_CONTENT_CHARS)
         
         return email_data
-        
+    
     except Exception as e:
         print(f"Error parsing email: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class ParsedEmail:
+    """
+    Compact parsed email: the Gmail message ID, the dedup key and the body text
+    The key is (From, Subject, Date), plus the message key with DEDUP_KEY = 'message_id'
+    Holds no reference to the raw Gmail payload
+    """
+    
+    __slots__ = ('message_id', 'key', 'content')
+    
+    def __init__(self, message_id, key, content):
+        self.message_id = message_id
+        self.key = key
+        self.content = content
+    
+    @property
+    def subject(self):
+        return self.key[1]
+    
+    def to_row(self):
+        """
+        Returns: sheet row [From, Subject, Date, Content], plus Message-ID if the key has one
+        """
+        return [self.key[0], self.key[1], self.key[2], self.content, *self.key[3:]]
+
+
+def parse_email_record(message):
+    """
+    Parse email message into a compact record
+    Returns: ParsedEmail, or None if parsing failed
+    """
+    email_data = parse_email(message)
+    if email_data is None:
+        return None
+    return ParsedEmail(message['id'], build_dedup_key(message, email_data), email_data['Content'])
+
+
+def _get_executor(workers):
+    """
+    Return the shared process pool, creating it on first use or when workers changes
+    Safe to call from several threads (the pipeline's parse workers share the pool)
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None and _executor_workers != workers:
+            # Work already submitted to the old pool still finishes
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def _discard_executor(executor):
+    """
+    Shut down a pool that failed, so its worker processes exit, and stop handing it out
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        # cancel_futures needs Python 3.9
+        executor.shutdown(wait=False)
+
+
+def _parse_serial(parse, messages, release):
+    """
+    Parse messages one at a time, optionally dropping each raw message once it is parsed
+    """
+    if not release:
+        return [parse(message) for message in messages]
+    
+    results = []
+    for i in range(len(messages)):
+        results.append(parse(messages[i]))
+        messages[i] = None
+    messages.clear()
+    return results
+
+
+def _parse_all(parse, messages, workers, chunk_size, release=False):
+    """
+    Apply parse to every message, in parallel worker processes for large batches
+    release: empty messages in place so raw payloads can be freed (as each message is parsed
+             when serial, once the whole batch is back when parallel)
+    """
+    if workers is None:
+        workers = config.PARSE_WORKERS
+    if chunk_size is None:
+        chunk_size = config.PARSE_CHUNK_SIZE
+    
+    if workers <= 1 or len(messages) < config.PARSE_PARALLEL_MIN:
+        return _parse_serial(parse, messages, release)
+    
+    executor = _get_executor(workers)
+    try:
+        results = list(executor.map(parse, messages, chunksize=chunk_size))
+    except Exception as e:
+        print(f"Error in parallel parsing, falling back to serial: {e}")
+        _discard_executor(executor)
+        return _parse_serial(parse, messages, release)
+    
+    if release:
+        messages.clear()
+    return results
+
+
+def parse_email_records(messages, workers=None, chunk_size=None):
+    """
+    Parse a list of email messages into ParsedEmail records, emptying messages as it goes
+    so each raw Gmail payload can be freed once it has been parsed
+    Uses PARSE_WORKERS processes for batches of at least PARSE_PARALLEL_MIN messages
+    Returns: list of ParsedEmail (None for failures) in the original order of messages
+    """
+    return _parse_all(parse_email_record, messages, workers, chunk_size, release=True)
@@ -2,117 +2,379 @@
 Gmail Service Module - Handles Gmail API authentication and operations
 """
 
-import os
-import pickle
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import time
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.errors import HttpError
 
 import config
+from src.auth import build_service
+from src.metrics import record_api_call
+from src.rate_limiter import acquire, call_with_retry, is_rate_limit_error, report_rate_limited
+
+# Added to a page iterator's failed set when a page of message IDs could not be listed,
+# or when max_results was reached while more unread emails remained
+LIST_FAILED = '<list failed>'
+MAX_RESULTS_REACHED = '<max_results reached>'
 
 
 def authenticate_gmail():
     """
     Authenticate with Gmail API using OAuth 2.0
+    Credentials are shared with the other services built in this process
     Returns: Gmail API service object
     """
-    creds = None
-    
-    # Combine all scopes (Gmail + Sheets) for single authentication
-    ALL_SCOPES = config.GMAIL_SCOPES + config.SHEETS_SCOPES
-    
-    # Token file stores the user's access and refresh tokens
-    if os.path.exists(config.TOKEN_FILE):
+    try:
+        service = build_service('gmail', 'v1')
+        print("Gmail service initialized successfully")
+        return service
+    except HttpError as error:
+        print(f"An error occurred: {error}")
+        return None
+
+
+def build_get_request(service, message_id, format='full', metadata_headers=None):
+    """
+    Build a messages.get request for one message
+    metadata_headers: header names to return when format is 'metadata'
+    The response is trimmed to the FIELD_MASKS entry for the format
+    """
+    kwargs = {}
+    if metadata_headers:
+        kwargs['metadataHeaders'] = metadata_headers
+    mask = 'gmail.messages.get.metadata' if format == 'metadata' else 'gmail.messages.get'
+    return service.users().messages().get(
+        userId='me',
+        id=message_id,
+        format=format,
+        fields=config.FIELD_MASKS.get(mask),
+        **kwargs
+    )
+
+
+def fetch_messages_serial(service, messages, format='full', metadata_headers=None, gone=None):
+    """
+    Fetch message details one request at a time
+    gone: optional set that receives the IDs of messages that no longer exist (404)
+    Returns: List of email messages
+    """
+    full_messages = []
+    for i, message in enumerate(messages, 1):
         try:
-            creds = Credentials.from_authorized_user_file(config.TOKEN_FILE, ALL_SCOPES)
-        except Exception as e:
-            print(f"Error loading credentials: {e}")
-            creds = None
+            print(f"Fetching email {i}/{len(messages)}...", end='\r')
+            msg = build_get_request(service, message['id'], format, metadata_headers).execute()
+            full_messages.append(msg)
+        except HttpError as error:
+            print(f"\nError fetching message {message['id']}: {error}")
+            if gone is not None and error.resp.status == 404:
+                gone.add(message['id'])
+            continue
+    
+    return full_messages
+
+
+def fetch_messages_batch(service, messages, batch_size=None, format='full', metadata_headers=None, gone=None):
+    """
+    Fetch message details using Gmail batch requests
+    Sends up to batch_size messages.get calls per HTTP round trip
+    gone: same as for fetch_messages_serial
+    Returns: List of email messages (in the same order as messages)
+    """
+    if batch_size is None:
+        batch_size = config.BATCH_SIZE
+    # Gmail rejects batches larger than 100 calls
+    batch_size = max(1, min(batch_size, 100))
     
-    # If no valid credentials, let user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                print("Refreshing access token...")
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Error refreshing token: {e}")
-                creds = None
+    full_messages = []
+    for start in range(0, len(messages), batch_size):
+        chunk = messages[start:start + batch_size]
+        responses = {}
         
-        if not creds:
-            if not os.path.exists(config.CREDENTIALS_FILE):
-                raise FileNotFoundError(
-                    f"Credentials file not found at {config.CREDENTIALS_FILE}\n"
-                    "Please download credentials.json from Google Cloud Console"
-                )
-            
-            print("Starting OAuth 2.0 flow for Gmail AND Sheets...")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                config.CREDENTIALS_FILE, 
-                ALL_SCOPES  # Request both Gmail and Sheets scopes
+        def callback(request_id, response, exception):
+            if exception is not None:
+                print(f"\nError fetching message {request_id}: {exception}")
+                if is_rate_limit_error(exception):
+                    report_rate_limited('gmail.users.messages.get')
+                elif gone is not None and getattr(getattr(exception, 'resp', None), 'status', None) == 404:
+                    gone.add(request_id)
+            else:
+                responses[request_id] = response
+        
+        batch = service.new_batch_http_request(callback=callback)
+        for message in chunk:
+            batch.add(
+                build_get_request(service, message['id'], format, metadata_headers),
+                request_id=message['id']
             )
-            creds = flow.run_local_server(port=0)
-            print("Authentication successful!")
         
-        # Save credentials for future runs
-        with open(config.TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
+        print(f"Fetching emails {start + 1}-{start + len(chunk)}/{len(messages)}...", end='\r')
+        # Batched calls bypass the metered request class, so charge the rate limiter here
+        acquire('gmail.users.messages.get', calls=len(chunk))
+        batch_start = time.perf_counter()
+        try:
+            batch.execute()
+        except HttpError as error:
+            print(f"\nError executing batch request: {error}")
+            record_api_call('gmail.users.messages.get', calls=len(chunk), errors=len(chunk), round_trips=1,
+                            seconds=time.perf_counter() - batch_start)
+            continue
+        # Batched calls bypass the per-request accounting, so record them here
+        record_api_call('gmail.users.messages.get', calls=len(chunk), errors=len(chunk) - len(responses),
+                        round_trips=1, seconds=time.perf_counter() - batch_start)
+        
+        for message in chunk:
+            if message['id'] in responses:
+                full_messages.append(responses[message['id']])
+    
+    return full_messages
+
+
+def fetch_messages_parallel(service, messages, workers, format='full', metadata_headers=None, gone=None):
+    """
+    Fetch message details from a pool of worker threads sharing service
+    Each worker sends whole batch requests (or single calls) over its own pooled keep-alive
+    connection, so service must be built on a thread-safe transport (see auth.HttpPool)
+    Returns: List of email messages (in the same order as messages)
+    """
+    # One task per batch request, or per message when batching is off
+    size = max(1, min(config.BATCH_SIZE, 100)) if config.USE_BATCH_FETCH else 1
+    chunks = [messages[start:start + size] for start in range(0, len(messages), size)]
     
+    def fetch_chunk(chunk):
+        return fetch_messages(service, chunk, format, metadata_headers, workers=1, gone=gone)
+    
+    full_messages = []
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        for chunk_messages in executor.map(fetch_chunk, chunks):
+            full_messages.extend(chunk_messages)
+    return full_messages
+
+
+def fetch_messages(service, messages, format='full', metadata_headers=None, workers=None, gone=None):
+    """
+    Fetch message details for a list of message stubs
+    Uses batch requests when USE_BATCH_FETCH is enabled, sent from workers threads
+    (default FETCH_WORKERS) when there is more than one request to make
+    gone: optional set that receives the IDs of messages that no longer exist (404)
+    Returns: List of email messages
+    """
+    if workers is None:
+        workers = config.FETCH_WORKERS
+    if workers > 1 and len(messages) > (config.BATCH_SIZE if config.USE_BATCH_FETCH else 1):
+        return fetch_messages_parallel(service, messages, workers, format, metadata_headers, gone)
+    if config.USE_BATCH_FETCH:
+        return fetch_messages_batch(service, messages, format=format, metadata_headers=metadata_headers,
+                                    gone=gone)
+    return fetch_messages_serial(service, messages, format, metadata_headers, gone)
+
+
+def fetch_full_messages(service, messages, workers=None, gone=None):
+    """
+    Fetch full message details for a list of message stubs
+    Returns: List of email messages
+    """
+    return fetch_messages(service, messages, workers=workers, gone=gone)
+
+
+def fetch_message_metadata(service, messages, workers=None):
+    """
+    Fetch only the From, Subject and Date headers (and Message-ID with DEDUP_KEY = 'message_id')
+    for a list of message stubs
+    Returns: List of email messages in 'metadata' format
+    """
+    headers = ['From', 'Subject', 'Date']
+    if config.DEDUP_KEY == 'message_id':
+        headers.append('Message-ID')
+    return fetch_messages(service, messages, 'metadata', headers, workers)
+
+
+def list_message_page(service, query, page_size=100, page_token=None):
+    """
+    List one page of message stubs matching a Gmail search query
+    Returns: messages.list response dict (messages, nextPageToken), or None on error
+    """
     try:
-        service = build('gmail', 'v1', credentials=creds)
-        print("Gmail service initialized successfully")
-        return service
+        return service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=page_size,
+            pageToken=page_token,
+            fields=config.FIELD_MASKS.get('gmail.messages.list')
+        ).execute()
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        print(f"An error occurred while fetching emails: {error}")
         return None
 
 
-def get_unread_emails(service, max_results=100):
+def record_fetch_failures(failed, messages, full_messages, gone):
     """
-    Fetch unread emails from inbox
-    Returns: List of email messages
+    Add the IDs of message stubs missing from full_messages to the failed set (if given)
+    Messages deleted since they were listed (the IDs in gone) are not failures
     """
-    try:
-        print(f"Fetching unread emails (max: {max_results})...")
+    if failed is None or len(full_messages) == len(messages):
+        return
+    fetched_ids = {msg['id'] for msg in full_messages}
+    failed.update(msg['id'] for msg in messages if msg['id'] not in fetched_ids and msg['id'] not in gone)
+
+
+def iter_unread_emails(service, page_size=100, max_results=None, message_filter=None, workers=None,
+                       failed=None):
+    """
+    Page through unread emails in the inbox
+    Follows nextPageToken until the backlog is drained (or max_results is reached)
+    message_filter: optional function that takes a page of message stubs and returns
+                    the ones whose full bodies should be downloaded
+    workers: threads fetching each page's messages (default FETCH_WORKERS)
+    failed: optional set that receives the IDs of emails that could not be fetched, LIST_FAILED
+            if a page of IDs could not be listed, and MAX_RESULTS_REACHED if max_results stopped
+            the listing while more unread emails remained
+    Yields: List of full email messages, one list per page
+    """
+    fetched = 0
+    page = 0
+    page_token = None
+    
+    while True:
+        limit = page_size
+        if max_results is not None:
+            limit = min(page_size, max_results - fetched)
+            if limit <= 0:
+                if failed is not None and page_token:
+                    failed.add(MAX_RESULTS_REACHED)
+                return
         
         # Query for unread emails in inbox
-        results = service.users().messages().list(
-            userId='me',
-            q='is:unread in:inbox',
-            maxResults=max_results
-        ).execute()
+        results = list_message_page(service, 'is:unread in:inbox', limit, page_token)
+        if results is None:
+            if failed is not None:
+                failed.add(LIST_FAILED)
+            return
         
         messages = results.get('messages', [])
         
         if not messages:
-            print("No unread emails found.")
-            return []
+            if page == 0:
+                print("No unread emails found.")
+            return
         
-        print(f"Found {len(messages)} unread email(s)")
-        
-        # Fetch full message details for each email
-        full_messages = []
-        for i, message in enumerate(messages, 1):
-            try:
-                print(f"Fetching email {i}/{len(messages)}...", end='\r')
-                msg = service.users().messages().get(
-                    userId='me',
-                    id=message['id'],
-                    format='full'
-                ).execute()
-                full_messages.append(msg)
-            except HttpError as error:
-                print(f"\nError fetching message {message['id']}: {error}")
-                continue
+        page += 1
+        fetched += len(messages)
+        print(f"Found {len(messages)} unread email(s) on page {page}")
         
+        if message_filter is not None:
+            messages = message_filter(messages)
+        gone = set()
+        full_messages = fetch_full_messages(service, messages, workers, gone)
         print(f"\nSuccessfully fetched {len(full_messages)} email(s)")
-        return full_messages
+        record_fetch_failures(failed, messages, full_messages, gone)
+        
+        if full_messages:
+            yield full_messages
         
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def get_unread_emails(service, max_results=100, workers=None):
+    """
+    Fetch unread emails from inbox
+    max_results: None fetches every unread email
+    workers: threads sending messages.get calls in parallel (default FETCH_WORKERS)
+    Returns: List of email messages
+    """
+    print(f"Fetching unread emails (max: {max_results})...")
+    
+    full_messages = []
+    # messages.list returns at most 500 IDs per page
+    page_size = 500 if max_results is None else min(max_results, 500)
+    for chunk in iter_unread_emails(service, page_size, max_results, workers=workers):
+        full_messages.extend(chunk)
+    
+    return full_messages
+
+
+def get_current_history_id(service):
+    """
+    Get the mailbox's current historyId (checkpoint for incremental sync)
+    Returns: historyId string, or None on error
+    """
+    try:
+        profile = service.users().getProfile(
+            userId='me',
+            fields=config.FIELD_MASKS.get('gmail.getProfile')
+        ).execute()
+        return profile.get('historyId')
     except HttpError as error:
-        print(f"An error occurred while fetching emails: {error}")
-        return []
+        print(f"Error reading mailbox profile: {error}")
+        return None
+
+
+def get_history_message_ids(service, start_history_id):
+    """
+    List messages added to the inbox since start_history_id using the History API
+    Returns: tuple (list of message IDs, new historyId),
+             or None if the checkpoint has expired or the call failed
+    """
+    message_ids = []
+    seen = set()
+    page_token = None
+    
+    try:
+        while True:
+            results = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes='messageAdded',
+                labelId='INBOX',
+                maxResults=500,
+                pageToken=page_token,
+                fields=config.FIELD_MASKS.get('gmail.history.list')
+            ).execute()
+            
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added.get('message', {})
+                    msg_id = message.get('id')
+                    if msg_id and msg_id not in seen and 'UNREAD' in message.get('labelIds', []):
+                        seen.add(msg_id)
+                        message_ids.append(msg_id)
+            
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+    except HttpError as error:
+        if error.resp.status == 404:
+            print("History checkpoint has expired, falling back to full query")
+        else:
+            print(f"Error listing mailbox history: {error}")
+        return None
+    
+    print(f"Found {len(message_ids)} new email(s) since last checkpoint")
+    return message_ids, results.get('historyId', start_history_id)
+
+
+def iter_emails_by_id(service, message_ids, page_size=100, message_filter=None, failed=None):
+    """
+    Fetch full messages for a list of message IDs, skipping ones no longer unread in the inbox
+    message_filter, failed: same as for iter_unread_emails
+    Yields: List of full email messages, one list per page_size IDs
+    """
+    for start in range(0, len(message_ids), page_size):
+        stubs = [{'id': msg_id} for msg_id in message_ids[start:start + page_size]]
+        if message_filter is not None:
+            stubs = message_filter(stubs)
+        gone = set()
+        full_messages = fetch_full_messages(service, stubs, gone=gone)
+        print(f"\nSuccessfully fetched {len(full_messages)} email(s)")
+        record_fetch_failures(failed, stubs, full_messages, gone)
+        
+        # Messages may have been read or archived since they arrived
+        full_messages = [
+            msg for msg in full_messages
+            if {'UNREAD', 'INBOX'} <= set(msg.get('labelIds', []))
+        ]
+        if full_messages:
+            yield full_messages
 
 
 def mark_email_as_read(service, message_id):
@@ -123,7 +385,8 @@ def mark_email_as_read(service, message_id):
         service.users().messages().modify(
             userId='me',
             id=message_id,
-            body={'removeLabelIds': ['UNREAD']}
+            body={'removeLabelIds': ['UNREAD']},
+            fields=config.FIELD_MASKS.get('gmail.messages.modify')
         ).execute()
         return True
     except HttpError as error:
@@ -131,14 +394,47 @@ def mark_email_as_read(service, message_id):
         return False
 
 
+def batch_mark_as_read(service, message_ids):
+    """
+    Mark a chunk of emails as read with one messages.batchModify call
+    Rate-limit (429, 403 rateLimitExceeded) and server (5xx) errors are retried for the
+    same chunk with jittered exponential backoff. A 400 or 404, which one bad or deleted
+    ID can cause, splits the chunk in half so the other IDs still get marked
+    Returns: Number of emails marked as read
+    """
+    if not message_ids:
+        return 0
+    
+    request = service.users().messages().batchModify(
+        userId='me',
+        body={'ids': list(message_ids), 'removeLabelIds': ['UNREAD']}
+    )
+    try:
+        call_with_retry(request.execute, config.MODIFY_MAX_RETRIES, 'Gmail')
+        return len(message_ids)
+    except HttpError as error:
+        if error.resp.status in (400, 404) and len(message_ids) > 1:
+            print(f"Error batch marking {len(message_ids)} email(s) as read, "
+                  f"retrying in smaller chunks: {error}")
+            middle = len(message_ids) // 2
+            return (batch_mark_as_read(service, message_ids[:middle]) +
+                    batch_mark_as_read(service, message_ids[middle:]))
+        
+        print(f"Error batch marking {len(message_ids)} email(s) as read: {error}")
+        return 0
+
+
 def mark_emails_as_read(service, message_ids):
     """
     Mark multiple emails as read
+    Sends messages.batchModify calls of up to MODIFY_BATCH_SIZE IDs each
     """
+    # batchModify accepts at most 1000 IDs per call
+    chunk_size = max(1, min(config.MODIFY_BATCH_SIZE, 1000))
+    
     success_count = 0
-    for msg_id in message_ids:
-        if mark_email_as_read(service, msg_id):
-            success_count += 1
+    for start in range(0, len(message_ids), chunk_size):
+        success_count += batch_mark_as_read(service, message_ids[start:start + chunk_size])
     
     print(f"Marked {success_count}/{len(message_ids)} email(s) as read")
-    return success_count
\ No newline at end of file
+    return success_count
@@ -0,0 +1,124 @@
+"""
+Mailboxes module - processes several mailbox profiles in parallel worker processes
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import config
+
+
+def get_profile(name):
+    """
+    Find a mailbox profile by name
+    Returns: profile dict, or None if not configured
+    """
+    for profile in config.MAILBOX_PROFILES:
+        if profile.get('name') == name:
+            return profile
+    return None
+
+
+def apply_profile(profile):
+    """
+    Point the config module at one mailbox's credentials, state and destination sheet
+    Any other config setting can be overridden by putting its name in the profile
+    """
+    name = profile['name']
+    
+    # Per-mailbox files default to names derived from the profile name
+    config.TOKEN_FILE = os.path.join('credentials', f'token_{name}.json')
+    config.STATE_FILE = f'state_{name}.json'
+    config.STATE_DB_FILE = f'state_{name}.db'
+    config.DEDUP_INDEX_FILE = f'dedup_index_{name}.json'
+    config.BACKFILL_CHECKPOINT_FILE = f'backfill_checkpoint_{name}.json'
+    if config.METRICS_REPORT_FILE:
+        root, ext = os.path.splitext(config.METRICS_REPORT_FILE)
+        config.METRICS_REPORT_FILE = f'{root}_{name}{ext}'
+    if config.METRICS_PROMETHEUS_FILE:
+        root, ext = os.path.splitext(config.METRICS_PROMETHEUS_FILE)
+        config.METRICS_PROMETHEUS_FILE = f'{root}_{name}{ext}'
+    
+    for key, value in profile.items():
+        if key != 'name':
+            setattr(config, key, value)
+
+
+def run_profile(profile, log_file):
+    """
+    Worker process entry point: run one mailbox with its output going to log_file
+    """
+    # Imported in the worker so the parent process stays light
+    from src.main import main
+    
+    with open(log_file, 'a', buffering=1) as log:
+        sys.stdout = log
+        sys.stderr = log
+        try:
+            apply_profile(profile)
+            main()
+        except Exception:
+            traceback.print_exc()
+            sys.exit(1)
+
+
+def run_all_mailboxes(profiles=None, max_workers=None, timeout=None):
+    """
+    Process every mailbox profile, at most max_workers at a time, each in its own process
+    A mailbox that fails or runs longer than timeout seconds is reported
+    and does not hold up the others
+    Returns: dict of profile name -> 'ok', 'failed' or 'timed out'
+    """
+    if profiles is None:
+        profiles = config.MAILBOX_PROFILES
+    if max_workers is None:
+        max_workers = config.MAX_CONCURRENT_MAILBOXES
+    if timeout is None:
+        timeout = config.MAILBOX_TIMEOUT
+    
+    os.makedirs(config.MAILBOX_LOG_DIR, exist_ok=True)
+    
+    pending = list(profiles)
+    running = {}  # name -> (process, start time)
+    results = {}
+    
+    print(f"Processing {len(pending)} mailbox(es), {max_workers} at a time...")
+    
+    while pending or running:
+        # Start workers up to the concurrency cap
+        while pending and len(running) < max_workers:
+            profile = pending.pop(0)
+            name = profile['name']
+            log_file = os.path.join(config.MAILBOX_LOG_DIR, f'{name}.log')
+            process = multiprocessing.Process(
+                target=run_profile,
+                args=(profile, log_file),
+                name=f'mailbox-{name}'
+            )
+            process.start()
+            running[name] = (process, time.monotonic())
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Started {name} (log: {log_file})")
+        
+        # Collect finished workers and stop ones past the timeout
+        for name, (process, started) in list(running.items()):
+            if not process.is_alive():
+                process.join()
+                results[name] = 'ok' if process.exitcode == 0 else 'failed'
+            elif timeout and time.monotonic() - started > timeout:
+                process.terminate()
+                process.join()
+                results[name] = 'timed out'
+            else:
+                continue
+            del running[name]
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {name}: {results[name]}")
+        
+        time.sleep(0.2)
+    
+    failed = [name for name, result in results.items() if result != 'ok']
+    print(f"Finished {len(results)} mailbox(es), {len(failed)} with problems")
+    return results
@@ -2,6 +2,8 @@
 Main script - Orchestrates Gmail to Sheets automation
 """
 
+import argparse
+import functools
 import json
 import os
 import sys
@@ -11,50 +13,376 @@ from datetime import datetime
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 import config
-from src.gmail_service import authenticate_gmail, get_unread_emails, mark_emails_as_read
+from src.gmail_service import (
+    authenticate_gmail,
+    fetch_message_metadata,
+    iter_unread_emails,
+    iter_emails_by_id,
+    get_current_history_id,
+    get_history_message_ids,
+    mark_emails_as_read,
+    LIST_FAILED,
+    MAX_RESULTS_REACHED
+)
 from src.sheets_service import (
     authenticate_sheets, 
     initialize_sheet, 
-    batch_append_to_sheet,
     get_existing_emails
 )
-from src.email_parser import parse_email
+from src.email_parser import parse_email_records, get_dedup_key
+from src.dedup_index import get_existing_emails_indexed
+from src.dedup_keys import KeyHashSet
+from src.state_store import open_state_store
+from src.partitions import append_records, open_partitions
+from src import metrics
+
+
+def already_handled(state, message_id):
+    """
+    Check whether a message was processed, or parsed and is waiting in the outbox
+    """
+    return message_id in state or (config.USE_OUTBOX and state.in_outbox(message_id))
+
+
+def finish_records(message_ids, gmail_service, state):
+    """
+    Mark emails whose rows are in the sheet as read and record them as processed
+    (which also removes them from the outbox)
+    """
+    # Mark emails as read
+    if config.MARK_AS_READ:
+        print("\n[Step 8] Marking emails as read...")
+        with metrics.stage('mark_read'):
+            mark_emails_as_read(gmail_service, message_ids)
+            metrics.count_items('mark_read', len(message_ids))
+    
+    # Update state
+    print("\n[Step 9] Updating state...")
+    with metrics.stage('update_state'):
+        state.add_processed(message_ids)
+        state.set('last_run', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        metrics.count_items('update_state', len(message_ids))
+
+
+def deliver_records(records, gmail_service, sheets_service, state, existing_emails):
+    """
+    Append parsed emails to the sheet, then mark the ones that landed as read
+    With USE_OUTBOX the records are saved to the outbox first, so a failed or
+    interrupted append is retried from there without fetching or parsing again
+    Returns: tuple (rows added to sheet, whether any append failed)
+    """
+    if config.USE_OUTBOX:
+        state.outbox_add(records)
+    
+    # Append to Google Sheet
+    print("\n[Step 7] Adding emails to Google Sheet...")
+    with metrics.stage('append'):
+        landed = append_records(sheets_service, records, existing_emails)
+        metrics.count_items('append', len(landed))
+    
+    # Only emails whose chunk landed are marked as read and recorded in state
+    landed_ids = [record.message_id for record in landed]
+    # Later pages are checked against the rows we just wrote
+    existing_emails.update(record.key for record in landed)
+    rows_added = len(landed_ids)
+    append_failed = rows_added < len(records)
+    
+    if landed_ids:
+        if config.USE_OUTBOX:
+            state.outbox_mark_appended(landed_ids)
+        finish_records(landed_ids, gmail_service, state)
+    
+    return rows_added, append_failed
 
 
-def load_state():
+def drain_outbox(gmail_service, sheets_service, state, existing_emails):
     """
-    Load state from state.json
-    Returns: dict with processed_message_ids
+    Finish emails left in the outbox by an earlier run before any new mail is fetched
+    Rows already in the sheet (appended before a crash or failure further on) are not appended again
+    Returns: tuple (emails finished, rows added to sheet, whether any append failed)
     """
-    if os.path.exists(config.STATE_FILE):
-        try:
-            with open(config.STATE_FILE, 'r') as f:
-                state = json.load(f)
-                print(f"Loaded state: {len(state.get('processed_message_ids', []))} processed email(s)")
-                return state
-        except Exception as e:
-            print(f"Error loading state: {e}")
-            return {'processed_message_ids': []}
+    entries = state.outbox_records()
+    if not entries:
+        return 0, 0, False
+    
+    print(f"\n[Outbox] Finishing {len(entries)} email(s) parsed in an earlier run...")
+    in_sheet = [record for record, appended in entries if appended or record.key in existing_emails]
+    pending = [record for record, appended in entries if not appended and record.key not in existing_emails]
+    
+    if in_sheet:
+        print(f"{len(in_sheet)} email(s) already in the sheet")
+        finish_records([record.message_id for record in in_sheet], gmail_service, state)
+    
+    rows_added, append_failed = 0, False
+    if pending:
+        rows_added, append_failed = deliver_records(
+            pending,
+            gmail_service,
+            sheets_service,
+            state,
+            existing_emails
+        )
+    return len(in_sheet) + rows_added, rows_added, append_failed
+
+
+def process_messages(messages, gmail_service, sheets_service, state, existing_emails, failed=None):
+    """
+    Filter, parse, append and mark read one page of fetched messages
+    messages is emptied while parsing so raw Gmail payloads are freed early; only compact
+    ParsedEmail records are kept for the append and mark-as-read steps
+    failed: optional set that receives the IDs of emails that could not be parsed
+    Returns: tuple (new emails processed, rows added to sheet, whether any append failed)
+    """
+    # Filter out already processed messages
+    print("\n[Step 5] Filtering new emails...")
+    with metrics.stage('filter'):
+        new_messages = []
+        for msg in messages:
+            msg_id = msg['id']
+            if not already_handled(state, msg_id):
+                new_messages.append(msg)
+            else:
+                print(f"Skipping already processed email: {msg_id}")
+        metrics.count_items('filter', len(new_messages))
+    # The raw payloads now only live in new_messages
+    messages.clear()
+    
+    if not new_messages:
+        print("All emails have already been processed")
+        return 0, 0, False
+    
+    print(f"Found {len(new_messages)} new email(s) to process")
+    
+    # Parse emails
+    print("\n[Step 6] Parsing email data...")
+    parsed_emails = []
+    
+    print(f"Parsing {len(new_messages)} email(s)...", end='\r')
+    with metrics.stage('parse'):
+        # parse_email_records empties new_messages, so keep the IDs for reporting failures
+        message_ids = [msg['id'] for msg in new_messages]
+        for msg_id, record in zip(message_ids, parse_email_records(new_messages)):
+            if record:
+                # Check if this email already exists in sheet
+                if record.key not in existing_emails:
+                    parsed_emails.append(record)
+                else:
+                    print(f"\nSkipping duplicate: {record.subject}")
+            elif failed is not None:
+                failed.add(msg_id)
+        metrics.count_items('parse', len(parsed_emails))
+    
+    print(f"\nSuccessfully parsed {len(parsed_emails)} unique email(s)")
+    
+    if not parsed_emails:
+        print("No new unique emails to add to sheet")
+        return 0, 0, False
+    
+    rows_added, append_failed = deliver_records(
+        parsed_emails,
+        gmail_service,
+        sheets_service,
+        state,
+        existing_emails
+    )
+    return len(parsed_emails), rows_added, append_failed
+
+
+def make_message_filter(gmail_service, state, existing_emails):
+    """
+    Build the filter applied to each page of message stubs before full bodies are fetched
+    Drops IDs already in state or the outbox and, with METADATA_FIRST, messages whose
+    dedup key (From, Subject, Date, or Message-ID) is already in the sheet
+    An email whose headers could not be fetched is kept, downloaded in full and checked after parsing
+    Returns: function taking a list of message stubs (and check_headers=False to skip
+             the headers check) and returning the stubs to download
+    """
+    def message_filter(messages, check_headers=True):
+        messages = [msg for msg in messages if not already_handled(state, msg['id'])]
+        if not (config.METADATA_FIRST and check_headers) or not messages:
+            return messages
+        
+        print(f"Checking headers of {len(messages)} email(s) before downloading bodies...")
+        logged = set()
+        for msg in fetch_message_metadata(gmail_service, messages):
+            if get_dedup_key(msg) in existing_emails:
+                print(f"\nSkipping already logged email: {msg['id']}")
+                logged.add(msg['id'])
+        print()
+        
+        return [msg for msg in messages if msg['id'] not in logged]
+    
+    return message_filter
+
+
+def get_message_pages(gmail_service, state, message_filter=None, failed=None):
+    """
+    Choose between incremental (History API) and full-query fetching
+    failed: optional set that receives the IDs of emails the pages could not fetch
+    Returns: tuple (iterator of message pages, new historyId or None)
+             The iterator is None when incremental sync found nothing new
+    """
+    if not config.USE_INCREMENTAL_SYNC:
+        pages = iter_unread_emails(gmail_service, config.PAGE_SIZE, config.MAX_RESULTS, message_filter,
+                                   failed=failed)
+        return pages, None
+    
+    history_id = state.get('history_id')
+    if history_id:
+        history = get_history_message_ids(gmail_service, history_id)
+        if history is not None:
+            message_ids, new_history_id = history
+            if not message_ids:
+                return None, new_history_id
+            # History only lists mail that arrived since the checkpoint, which is rarely in the
+            # sheet already: checking its headers first would just double the messages.get calls
+            if message_filter is not None:
+                message_filter = functools.partial(message_filter, check_headers=False)
+            pages = iter_emails_by_id(gmail_service, message_ids, config.PAGE_SIZE, message_filter, failed)
+            return pages, new_history_id
     else:
-        print("No state file found, starting fresh")
-        return {'processed_message_ids': []}
+        print("No history checkpoint found, running full query")
+    
+    # Take the checkpoint before the full query so mail arriving mid-run is picked up next time
+    new_history_id = get_current_history_id(gmail_service)
+    pages = iter_unread_emails(gmail_service, config.PAGE_SIZE, config.MAX_RESULTS, message_filter,
+                               failed=failed)
+    return pages, new_history_id
 
 
-def save_state(state):
+def load_existing_emails(sheets_service, rebuild_index=False):
     """
-    Save state to state.json
+    Load the duplicate-check keys already in the sheet
+    With SHEET_PARTITION nothing is read up front: the returned SheetPartitions object
+    reads each partition tab the first time a key from it is checked
+    Returns: KeyHashSet, or SheetPartitions
     """
-    try:
-        with open(config.STATE_FILE, 'w') as f:
-            json.dump(state, f, indent=2)
-        print(f"State saved: {len(state.get('processed_message_ids', []))} total processed email(s)")
-    except Exception as e:
-        print(f"Error saving state: {e}")
+    if config.SHEET_PARTITION:
+        return open_partitions(sheets_service, rebuild_index)
+    if config.USE_DEDUP_INDEX:
+        return get_existing_emails_indexed(
+            sheets_service,
+            config.SPREADSHEET_ID,
+            config.SHEET_NAME,
+            rebuild=rebuild_index
+        )
+    return get_existing_emails(sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME)
 
 
-def main():
+def retry_parse_failures(state, message_ids):
     """
-    Main execution function
+    Count the runs each email has failed to parse in (the 'parse_failures' state entry)
+    An email that failed in PARSE_MAX_ATTEMPTS runs stops holding back the history checkpoint;
+    it is left unread in the inbox
+    Returns: set of the IDs to fetch again next run
+    """
+    previous = json.loads(state.get('parse_failures') or '{}')
+    # Emails that parsed this time (or were not listed again) drop out of the count
+    attempts = {msg_id: previous.get(msg_id, 0) + 1 for msg_id in message_ids}
+    if attempts or previous:
+        state.set('parse_failures', json.dumps(attempts))
+    
+    retry = set()
+    for msg_id, count in attempts.items():
+        if count < config.PARSE_MAX_ATTEMPTS:
+            retry.add(msg_id)
+        else:
+            print(f"Giving up on email {msg_id}: it failed to parse in {count} runs")
+    return retry
+
+
+def stop_when_set(pages, stop_event, totals):
+    """
+    Pass pages through until stop_event is set (checked after each page is processed)
+    """
+    for messages in pages:
+        yield messages
+        if stop_event.is_set():
+            totals['stopped'] = True
+            return
+
+
+def sync_pages(pages, gmail_service, sheets_service, state, existing_emails,
+               new_history_id=None, stop_event=None, failed=None):
+    """
+    Process every page of messages, then advance the history checkpoint if nothing was left behind
+    With USE_OUTBOX, emails left in the outbox by an earlier run are finished first
+    stop_event: optional threading.Event; once set, no further pages are fetched
+    failed: the set passed to get_message_pages. While it is not empty the checkpoint stays put,
+            so the next run fetches the emails again; emails that fail to parse are added to it
+            until they have failed in PARSE_MAX_ATTEMPTS runs
+    Returns: dict with found, processed, rows_added, append_failed, failed and stopped
+    """
+    if failed is None:
+        failed = set()
+    unparsed = set()
+    totals = {
+        'found': 0, 'processed': 0, 'rows_added': 0, 'append_failed': False, 'failed': 0, 'stopped': False
+    }
+    if config.USE_OUTBOX:
+        processed, rows_added, append_failed = drain_outbox(
+            gmail_service, sheets_service, state, existing_emails
+        )
+        totals['processed'] += processed
+        totals['rows_added'] += rows_added
+        totals['append_failed'] = append_failed
+    
+    # Each page fetch (and the metadata filter run inside it) is timed as the fetch stage
+    pages = metrics.timed_pages(pages)
+    if stop_event is not None:
+        pages = stop_when_set(pages, stop_event, totals)
+    
+    if config.USE_PIPELINE:
+        # Fetch, parse, append and mark-as-read stages run concurrently
+        from src.pipeline import run_pipeline
+        
+        result = run_pipeline(pages, gmail_service, sheets_service, state, existing_emails, unparsed)
+        totals['found'] += result['found']
+        totals['processed'] += result['processed']
+        totals['rows_added'] += result['rows_added']
+        totals['append_failed'] = totals['append_failed'] or result['append_failed']
+    else:
+        for messages in pages:
+            totals['found'] += len(messages)
+            processed, rows_added, append_failed = process_messages(
+                messages,
+                gmail_service,
+                sheets_service,
+                state,
+                existing_emails,
+                unparsed
+            )
+            totals['processed'] += processed
+            totals['rows_added'] += rows_added
+            totals['append_failed'] = totals['append_failed'] or append_failed
+    
+    if not totals['stopped']:
+        failed.update(retry_parse_failures(state, unparsed))
+    
+    # Advance the history checkpoint only if nothing was left behind
+    # (emails whose append failed are safe in the outbox when it is enabled)
+    left_behind = (totals['append_failed'] and not config.USE_OUTBOX) or failed
+    if (new_history_id and not totals['stopped'] and not left_behind
+            and new_history_id != state.get('history_id')):
+        state.set('history_id', new_history_id)
+    
+    totals['failed'] = len(failed - {LIST_FAILED, MAX_RESULTS_REACHED})
+    if totals['failed'] or LIST_FAILED in failed:
+        print(f"\nERROR: {totals['failed']} email(s) could not be fetched or parsed"
+              f"{' and the email list is incomplete' if LIST_FAILED in failed else ''}; "
+              "the history checkpoint was not advanced, so the next run tries again")
+    elif MAX_RESULTS_REACHED in failed:
+        print(f"\nStopped at MAX_RESULTS ({config.MAX_RESULTS}) with more unread emails left; "
+              "the next run continues with them")
+    
+    return totals
+
+
+def run_once(rebuild_index=False):
+    """
+    Run steps 1-9 once
+    rebuild_index: re-read the whole sheet into the local dedup index
+    Returns: dict of run totals, or None if the run stopped early
     """
     print("=" * 60)
     print("Gmail to Google Sheets Automation")
@@ -68,123 +396,178 @@ def main():
         return
     
     # Load state
-    state = load_state()
-    processed_ids = set(state.get('processed_message_ids', []))
+    state = open_state_store()
     
     # Authenticate services
     print("\n[Step 1] Authenticating with Google APIs...")
-    gmail_service = authenticate_gmail()
-    sheets_service = authenticate_sheets()
+    with metrics.stage('authenticate'):
+        gmail_service = authenticate_gmail()
+        sheets_service = authenticate_sheets()
     
     if not gmail_service or not sheets_service:
         print("ERROR: Authentication failed")
         return
     
+    # Decide where messages come from first, so a quiet incremental poll stops here
+    # (partition tabs are only read once a message's key is checked)
+    if config.SHEET_PARTITION:
+        existing_emails = load_existing_emails(sheets_service, rebuild_index)
+    else:
+        existing_emails = KeyHashSet()
+    message_filter = make_message_filter(gmail_service, state, existing_emails)
+    failed = set()
+    with metrics.stage('history'):
+        pages, new_history_id = get_message_pages(gmail_service, state, message_filter, failed)
+    
+    if pages is None:
+        if new_history_id != state.get('history_id'):
+            state.set('history_id', new_history_id)
+        if not (config.USE_OUTBOX and state.outbox_count()):
+            print("\nNo new emails to process")
+            print("=" * 60)
+            return {'found': 0, 'processed': 0, 'rows_added': 0}
+        # Nothing new in Gmail, but the outbox still has rows to write
+        pages = []
+    
     # Initialize sheet with headers
     print("\n[Step 2] Initializing Google Sheet...")
-    initialize_sheet(sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME)
+    if config.SHEET_PARTITION:
+        print(f"Partitioned by {config.SHEET_PARTITION}: tabs are created and initialized as rows arrive")
+    else:
+        with metrics.stage('initialize_sheet'):
+            initialize_sheet(sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME)
     
     # Get existing emails from sheet for duplicate check
     print("\n[Step 3] Checking for existing emails in sheet...")
-    existing_emails = get_existing_emails(sheets_service, config.SPREADSHEET_ID, config.SHEET_NAME)
+    if config.SHEET_PARTITION:
+        print("Only the partition tabs this run's emails belong to are read")
+    else:
+        with metrics.stage('load_existing'):
+            existing_emails.update(load_existing_emails(sheets_service, rebuild_index))
+            metrics.count_items('load_existing', len(existing_emails))
     
-    # Fetch unread emails
+    # Fetch unread emails page by page, processing each page before fetching the next
     print("\n[Step 4] Fetching unread emails from Gmail...")
-    messages = get_unread_emails(gmail_service, config.MAX_RESULTS)
-    
-    if not messages:
-        print("\nNo new emails to process")
-        print("=" * 60)
-        return
-    
-    # Filter out already processed messages
-    print("\n[Step 5] Filtering new emails...")
-    new_messages = []
-    for msg in messages:
-        msg_id = msg['id']
-        if msg_id not in processed_ids:
-            new_messages.append(msg)
-        else:
-            print(f"Skipping already processed email: {msg_id}")
-    
-    if not new_messages:
-        print("All emails have already been processed")
-        print("=" * 60)
-        return
-    
-    print(f"Found {len(new_messages)} new email(s) to process")
-    
-    # Parse emails
-    print("\n[Step 6] Parsing email data...")
-    parsed_emails = []
-    message_ids_to_mark = []
-    
-    for i, msg in enumerate(new_messages, 1):
-        print(f"Parsing email {i}/{len(new_messages)}...", end='\r')
-        
-        email_data = parse_email(msg)
-        
-        if email_data:
-            # Create identifier for duplicate check
-            identifier = (
-                email_data.get('From', ''),
-                email_data.get('Subject', ''),
-                email_data.get('Date', '')
-            )
-            
-            # Check if this email already exists in sheet
-            if identifier not in existing_emails:
-                parsed_emails.append(email_data)
-                message_ids_to_mark.append(msg['id'])
-            else:
-                print(f"\nSkipping duplicate: {email_data.get('Subject', 'No Subject')}")
-    
-    print(f"\nSuccessfully parsed {len(parsed_emails)} unique email(s)")
-    
-    if not parsed_emails:
-        print("No new unique emails to add to sheet")
-        print("=" * 60)
-        return
-    
-    # Append to Google Sheet
-    print("\n[Step 7] Adding emails to Google Sheet...")
-    rows_added = batch_append_to_sheet(
+    totals = sync_pages(
+        pages,
+        gmail_service,
         sheets_service,
-        config.SPREADSHEET_ID,
-        config.SHEET_NAME,
-        parsed_emails
+        state,
+        existing_emails,
+        new_history_id,
+        failed=failed
     )
+    total_found = totals['found']
+    total_processed = totals['processed']
+    total_rows_added = totals['rows_added']
     
-    if rows_added > 0:
-        # Mark emails as read
-        if config.MARK_AS_READ and message_ids_to_mark:
-            print("\n[Step 8] Marking emails as read...")
-            mark_emails_as_read(gmail_service, message_ids_to_mark)
-        
-        # Update state
-        print("\n[Step 9] Updating state...")
-        for msg_id in message_ids_to_mark:
-            processed_ids.add(msg_id)
-        
-        state['processed_message_ids'] = list(processed_ids)
-        state['last_run'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        save_state(state)
+    if not total_found and not total_processed:
+        print("\nNo new emails to process")
+        print("=" * 60)
+        return totals
     
     # Summary
     print("\n" + "=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total unread emails found: {len(messages)}")
-    print(f"New emails processed: {len(parsed_emails)}")
-    print(f"Rows added to sheet: {rows_added}")
-    print(f"Total processed (all time): {len(processed_ids)}")
+    print(f"Total unread emails found: {total_found}")
+    print(f"New emails processed: {total_processed}")
+    print(f"Rows added to sheet: {total_rows_added}")
+    if totals['failed']:
+        print(f"Failed to fetch or parse: {totals['failed']}")
+    print(f"Total processed (all time): {len(state)}")
     print(f"Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 60)
+    return totals
+
+
+def main(rebuild_index=False):
+    """
+    Main execution function
+    Records per-stage metrics for the run and writes them to METRICS_REPORT_FILE
+    (and METRICS_PROMETHEUS_FILE, if set), even when the run fails part-way
+    rebuild_index: re-read the whole sheet into the local dedup index
+    """
+    metrics.reset()
+    totals = None
+    try:
+        totals = run_once(rebuild_index)
+    finally:
+        report = metrics.write_reports(totals)
+    
+    if totals and totals['found']:
+        print("\nSTAGES")
+        metrics.print_stage_summary(report)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Log unread Gmail messages to Google Sheets')
+    parser.add_argument(
+        '--rebuild-index',
+        action='store_true',
+        help='rebuild the local dedup index from the whole sheet (use after editing the sheet by hand)'
+    )
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='keep running and poll Gmail on an adaptive interval until SIGTERM'
+    )
+    parser.add_argument(
+        '--mailbox',
+        metavar='NAME',
+        help='run a single profile from MAILBOX_PROFILES (use once per profile to complete OAuth)'
+    )
+    parser.add_argument(
+        '--all-mailboxes',
+        action='store_true',
+        help='process every profile in MAILBOX_PROFILES in parallel worker processes'
+    )
+    parser.add_argument(
+        '--backfill',
+        action='store_true',
+        help='log every email matching BACKFILL_QUERY, read mail included, without changing labels '
+             '(resumes from BACKFILL_CHECKPOINT_FILE)'
+    )
+    parser.add_argument(
+        '--query',
+        help='Gmail search query for --backfill (default: BACKFILL_QUERY)'
+    )
+    parser.add_argument(
+        '--after',
+        metavar='YYYY-MM-DD',
+        help='only backfill emails on or after this date (default: BACKFILL_AFTER)'
+    )
+    parser.add_argument(
+        '--before',
+        metavar='YYYY-MM-DD',
+        help='only backfill emails before this date (default: BACKFILL_BEFORE)'
+    )
+    args = parser.parse_args()
+    
     try:
-        main()
+        if args.mailbox:
+            from src.mailboxes import get_profile, apply_profile
+            
+            profile = get_profile(args.mailbox)
+            if profile is None:
+                print(f"ERROR: No mailbox profile named '{args.mailbox}' in config.py")
+                sys.exit(1)
+            apply_profile(profile)
+        
+        if args.all_mailboxes:
+            from src.mailboxes import run_all_mailboxes
+            
+            run_all_mailboxes()
+        elif args.backfill:
+            from src.backfill import main as run_backfill
+            
+            run_backfill(args.query, args.after, args.before, rebuild_index=args.rebuild_index)
+        elif args.daemon:
+            from src.daemon import run_daemon
+            
+            run_daemon(rebuild_index=args.rebuild_index)
+        else:
+            main(rebuild_index=args.rebuild_index)
     except KeyboardInterrupt:
         print("\n\nScript interrupted by user")
     except Exception as e:
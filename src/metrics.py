@@ -0,0 +1,331 @@
+"""
+Metrics module - per-stage timings, API call and quota accounting, and run reports
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+# Gmail quota units charged per method (Gmail API usage limits)
+GMAIL_QUOTA_UNITS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.history.list': 2,
+    'gmail.users.messages.list': 5,
+    'gmail.users.messages.get': 5,
+    'gmail.users.messages.modify': 5,
+    'gmail.users.messages.batchModify': 50,
+}
+
+_lock = threading.RLock()
+
+# Stage that API calls made in the current thread/task are attributed to
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+
+_run = {}
+
+# HttpRequest subclass used by build_service, created on first use
+_request_class = None
+
+
+def reset():
+    """
+    Start a new run, discarding everything recorded so far
+    """
+    with _lock:
+        _run.clear()
+        _run.update({
+            'started_at': datetime.now(),
+            'start': time.perf_counter(),
+            'stages': {},
+            'endpoints': {},
+            'gmail_units_by_second': {},
+            'sheets_calls_by_minute': {},
+        })
+
+
+def _get_run():
+    if not _run:
+        reset()
+    return _run
+
+
+def record_stage(name, seconds=0.0, items=0, nbytes=0, runs=0):
+    """
+    Add to the totals of one stage
+    """
+    with _lock:
+        stages = _get_run()['stages']
+        totals = stages.setdefault(name, {'runs': 0, 'seconds': 0.0, 'items': 0, 'bytes': 0})
+        totals['runs'] += runs
+        totals['seconds'] += seconds
+        totals['items'] += items
+        totals['bytes'] += nbytes
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of work as stage name; API traffic inside it is counted towards the stage
+    Concurrent workers of the same stage add up, so seconds is busy time, not wall time
+    """
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        record_stage(name, seconds=time.perf_counter() - start, runs=1)
+
+
+def count_items(name, items, nbytes=0):
+    """
+    Record items (and optionally bytes) handled by a stage
+    """
+    record_stage(name, items=items, nbytes=nbytes)
+
+
+def timed_pages(pages, name='fetch'):
+    """
+    Pass pages through, timing each fetch as stage name
+    """
+    pages = iter(pages)
+    while True:
+        with stage(name):
+            messages = next(pages, None)
+            if messages is not None:
+                count_items(name, len(messages))
+        if messages is None:
+            return
+        yield messages
+
+
+def record_api_call(method_id, calls=1, errors=0, round_trips=0, seconds=0.0,
+                    bytes_sent=0, bytes_received=0):
+    """
+    Add to the totals of one API method, e.g. 'gmail.users.messages.get'
+    Bytes are also counted towards the stage the call was made from
+    """
+    method_id = method_id or 'unknown'
+    units = GMAIL_QUOTA_UNITS.get(method_id, 0) * calls
+    now = time.time()
+    
+    with _lock:
+        run = _get_run()
+        totals = run['endpoints'].setdefault(method_id, {
+            'calls': 0,
+            'errors': 0,
+            'round_trips': 0,
+            'seconds': 0.0,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'quota_units': 0
+        })
+        totals['calls'] += calls
+        totals['errors'] += errors
+        totals['round_trips'] += round_trips
+        totals['seconds'] += seconds
+        totals['bytes_sent'] += bytes_sent
+        totals['bytes_received'] += bytes_received
+        totals['quota_units'] += units
+        
+        if units:
+            second = int(now)
+            run['gmail_units_by_second'][second] = run['gmail_units_by_second'].get(second, 0) + units
+        if calls and method_id.startswith('sheets.'):
+            minute = int(now // 60)
+            run['sheets_calls_by_minute'][minute] = run['sheets_calls_by_minute'].get(minute, 0) + calls
+    
+    current = _current_stage.get()
+    if current and (bytes_sent or bytes_received):
+        record_stage(current, nbytes=bytes_sent + bytes_received)
+
+
+def get_request_builder():
+    """
+    Get the HttpRequest subclass that records every executed call and applies the rate limiter
+    Returns: class to pass as requestBuilder when building a service
+    """
+    global _request_class
+    if _request_class is None:
+        from googleapiclient.http import HttpRequest
+        from src import rate_limiter
+        
+        class MeteredHttpRequest(HttpRequest):
+            def __init__(self, http, postproc, uri, *args, **kwargs):
+                # Response bytes are counted wherever the payload is decoded, which
+                # includes the individual parts of a batch response
+                def metered_postproc(resp, content):
+                    record_api_call(self.methodId, calls=0, bytes_received=len(content or b''))
+                    return postproc(resp, content)
+                
+                super().__init__(http, metered_postproc, uri, *args, **kwargs)
+            
+            def execute(self, http=None, num_retries=0):
+                # Held back until the call's quota cost fits the budget (not counted in seconds)
+                rate_limiter.acquire(self.methodId)
+                start = time.perf_counter()
+                failed = False
+                try:
+                    return super().execute(http=http, num_retries=num_retries)
+                except Exception as error:
+                    failed = True
+                    if rate_limiter.is_rate_limit_error(error):
+                        rate_limiter.report_rate_limited(self.methodId)
+                    raise
+                finally:
+                    record_api_call(
+                        self.methodId,
+                        errors=int(failed),
+                        round_trips=1,
+                        seconds=time.perf_counter() - start,
+                        bytes_sent=len(self.body or '')
+                    )
+        
+        _request_class = MeteredHttpRequest
+    return _request_class
+
+
+def build_report(summary=None):
+    """
+    Collect the current run's metrics
+    summary: optional dict of run totals (found, processed, rows_added, ...) to include
+    Returns: dict ready for JSON serialization
+    """
+    with _lock:
+        run = _get_run()
+        duration = time.perf_counter() - run['start']
+        stages = {name: dict(totals) for name, totals in run['stages'].items()}
+        endpoints = {name: dict(totals) for name, totals in run['endpoints'].items()}
+        peak_units = max(run['gmail_units_by_second'].values(), default=0)
+        peak_sheets = max(run['sheets_calls_by_minute'].values(), default=0)
+        started_at = run['started_at']
+    
+    for totals in list(stages.values()) + list(endpoints.values()):
+        totals['seconds'] = round(totals['seconds'], 4)
+    
+    gmail_units = sum(totals['quota_units'] for totals in endpoints.values())
+    sheets_calls = sum(totals['calls'] for name, totals in endpoints.items() if name.startswith('sheets.'))
+    
+    return {
+        'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'duration_seconds': round(duration, 4),
+        'summary': summary or {},
+        'stages': stages,
+        'endpoints': endpoints,
+        'quota': {
+            'gmail_units': gmail_units,
+            'gmail_peak_units_per_second': peak_units,
+            'gmail_limit_units_per_second': config.GMAIL_QUOTA_UNITS_PER_SECOND,
+            'sheets_calls': sheets_calls,
+            'sheets_peak_calls_per_minute': peak_sheets,
+            'sheets_limit_calls_per_minute': config.SHEETS_QUOTA_CALLS_PER_MINUTE,
+        },
+    }
+
+
+def _prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_prometheus(report):
+    """
+    Render a run report in the Prometheus text exposition format
+    Returns: str
+    """
+    prefix = 'gmail_to_sheets'
+    lines = []
+    
+    def gauge(name, help_text, samples):
+        lines.append(f'# HELP {prefix}_{name} {help_text}')
+        lines.append(f'# TYPE {prefix}_{name} gauge')
+        for labels, value in samples:
+            if labels:
+                label_text = ','.join(f'{key}="{_prometheus_label(val)}"' for key, val in labels.items())
+                lines.append(f'{prefix}_{name}{{{label_text}}} {value}')
+            else:
+                lines.append(f'{prefix}_{name} {value}')
+    
+    stages = report['stages']
+    endpoints = report['endpoints']
+    quota = report['quota']
+    
+    gauge('last_run_timestamp_seconds', 'Unix time the last run finished', [({}, int(time.time()))])
+    gauge('run_duration_seconds', 'Wall time of the last run', [({}, report['duration_seconds'])])
+    for key, value in report['summary'].items():
+        if isinstance(value, (int, float)):
+            gauge(f'run_{key}', f'Run total: {key}', [({}, int(value))])
+    
+    for field, help_text in [
+        ('seconds', 'Busy time per stage'),
+        ('items', 'Items handled per stage'),
+        ('bytes', 'API bytes transferred per stage'),
+    ]:
+        gauge(f'stage_{field}', help_text, [({'stage': name}, totals[field]) for name, totals in stages.items()])
+    
+    for field, help_text in [
+        ('calls', 'API calls per endpoint'),
+        ('errors', 'Failed API calls per endpoint'),
+        ('round_trips', 'HTTP round trips per endpoint'),
+        ('seconds', 'Time spent in API calls per endpoint'),
+        ('bytes_sent', 'Request bytes per endpoint'),
+        ('bytes_received', 'Response bytes per endpoint'),
+        ('quota_units', 'Gmail quota units per endpoint'),
+    ]:
+        gauge(f'api_{field}', help_text, [({'endpoint': name}, totals[field]) for name, totals in endpoints.items()])
+    
+    gauge('gmail_quota_units', 'Gmail quota units used by the last run', [({}, quota['gmail_units'])])
+    gauge('gmail_quota_peak_units_per_second', 'Highest Gmail quota units used in one second',
+          [({}, quota['gmail_peak_units_per_second'])])
+    gauge('sheets_peak_calls_per_minute', 'Highest Sheets API calls made in one minute',
+          [({}, quota['sheets_peak_calls_per_minute'])])
+    
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path, text):
+    # Write then rename, so readers (e.g. the node_exporter textfile collector) never see a partial file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_reports(summary=None):
+    """
+    Write the run report to METRICS_REPORT_FILE and, if set, METRICS_PROMETHEUS_FILE
+    Returns: report dict
+    """
+    report = build_report(summary)
+    try:
+        if config.METRICS_REPORT_FILE:
+            _write_atomic(config.METRICS_REPORT_FILE, json.dumps(report, indent=2))
+        if config.METRICS_PROMETHEUS_FILE:
+            _write_atomic(config.METRICS_PROMETHEUS_FILE, format_prometheus(report))
+    except OSError as e:
+        print(f"Error writing metrics report: {e}")
+    return report
+
+
+def print_stage_summary(report):
+    """
+    Print seconds, items and bytes per stage, plus API calls and Gmail quota units
+    """
+    print(f"{'Stage':<16}{'Seconds':>10}{'Items':>8}{'Bytes':>12}")
+    for name, totals in report['stages'].items():
+        print(f"{name:<16}{totals['seconds']:>10.3f}{totals['items']:>8}{totals['bytes']:>12}")
+    
+    calls = sum(totals['calls'] for totals in report['endpoints'].values())
+    quota = report['quota']
+    print(f"API calls: {calls} "
+          f"(Gmail quota units: {quota['gmail_units']}, "
+          f"peak {quota['gmail_peak_units_per_second']}/{quota['gmail_limit_units_per_second']} per second)")
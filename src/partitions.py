@@ -0,0 +1,260 @@
+"""
+Partitions module - routes rows to per-month or per-N-rows sheet tabs and keeps
+duplicate checks scoped to the tabs a run actually touches
+"""
+
+import os
+import re
+import threading
+
+import config
+from src.sheets_service import (
+    chunked_append_to_sheet,
+    create_sheet_tab,
+    get_existing_emails,
+    list_sheet_tabs
+)
+from src.dedup_index import get_existing_emails_indexed
+from src.dedup_keys import KeyHashSet
+from src import metrics
+
+# Parsed dates look like 'YYYY-MM-DD HH:MM:SS'
+_MONTH = re.compile(r'(\d{4})-(\d{2})-')
+
+
+def month_tab_name(date, sheet_name=None):
+    """
+    Tab for a parsed Date, e.g. EmailLog_2024_05
+    Rows without a usable date go to the base tab
+    """
+    if sheet_name is None:
+        sheet_name = config.SHEET_NAME
+    match = _MONTH.match(date or '')
+    if not match:
+        return sheet_name
+    return f'{sheet_name}_{match.group(1)}_{match.group(2)}'
+
+
+def partition_index_file(tab, index_file=None):
+    """
+    Dedup index file of one partition tab, e.g. dedup_index_EmailLog_2024_05.json
+    """
+    if index_file is None:
+        index_file = config.DEDUP_INDEX_FILE
+    root, ext = os.path.splitext(index_file)
+    return f'{root}_{tab}{ext}'
+
+
+class SheetPartitions:
+    """
+    Duplicate-check keys of a partitioned sheet, read one tab at a time
+    Stands in for the KeyHashSet of existing keys: 'key in partitions' only reads the
+    tab(s) the key can be in, so a run's cost does not grow with the sheet's history
+    mode 'month': a row goes to the tab of its Date's month
+    mode 'rows': rows go to the newest numbered tab (EmailLog_1, EmailLog_2, ...) until it
+                 holds max_rows; keys are checked against that tab and the one before it
+    In both modes keys are also checked against the base tab (sheet_name), which holds the
+    rows logged before partitioning was turned on
+    Nothing is read until the first check. Safe to share between threads
+    """
+    
+    def __init__(self, service, spreadsheet_id, sheet_name, mode, max_rows=None, rebuild=False):
+        if mode not in ('month', 'rows'):
+            raise ValueError(f"Unknown SHEET_PARTITION mode: {mode!r}")
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.mode = mode
+        self.max_rows = max_rows or config.PARTITION_MAX_ROWS
+        self.rebuild = rebuild
+        self.lock = threading.RLock()
+        self.keys = {}  # tab -> set of keys, for the tabs read so far
+        self.row_counts = {}  # tab -> rows written, for 'rows' mode
+        self.tabs = None  # Tabs in the spreadsheet (None = not listed yet, or listing failed)
+        self.ready = set()  # Tabs created or confirmed this run
+        self.current = None  # Number of the tab being filled, for 'rows' mode
+    
+    def _open(self):
+        if self.current is not None:
+            return
+        tabs = list_sheet_tabs(self.service, self.spreadsheet_id)
+        if tabs is not None:
+            self.tabs = set(tabs)
+            self.ready.update(tabs)
+        
+        numbers = [
+            int(match.group(1)) for match in
+            (re.fullmatch(re.escape(self.sheet_name) + r'_(\d+)', tab) for tab in tabs or [])
+            if match
+        ]
+        self.current = max(numbers, default=1)
+    
+    def _numbered(self, number):
+        return f'{self.sheet_name}_{number}'
+    
+    def _tab_for(self, key):
+        if self.mode == 'month':
+            return month_tab_name(key[2], self.sheet_name)
+        return self._numbered(self.current)
+    
+    def _check_tabs(self, key):
+        if self.mode == 'month':
+            tabs = [month_tab_name(key[2], self.sheet_name)]
+        else:
+            tabs = [self._numbered(number) for number in (self.current, self.current - 1) if number > 0]
+        if self.sheet_name not in tabs:
+            # Rows logged before partitioning stay in the base tab; it is read once per run
+            tabs.append(self.sheet_name)
+        return tabs
+    
+    def _read_keys(self, tab):
+        if self.tabs is not None and tab not in self.tabs:
+            # Not created yet, nothing to read
+            return KeyHashSet()
+        
+        with metrics.stage('load_existing'):
+            if config.USE_DEDUP_INDEX:
+                # The base tab keeps the index it had before partitioning
+                index_file = config.DEDUP_INDEX_FILE if tab == self.sheet_name else partition_index_file(tab)
+                keys = get_existing_emails_indexed(
+                    self.service,
+                    self.spreadsheet_id,
+                    tab,
+                    index_file,
+                    rebuild=self.rebuild
+                )
+            else:
+                keys = get_existing_emails(self.service, self.spreadsheet_id, tab)
+            metrics.count_items('load_existing', len(keys))
+        return keys
+    
+    def _tab_keys(self, tab):
+        with self.lock:
+            self._open()
+            keys = self.keys.get(tab)
+            if keys is None:
+                keys = self.keys[tab] = self._read_keys(tab)
+            return keys
+    
+    def __contains__(self, key):
+        with self.lock:
+            self._open()
+            return any(key in self._tab_keys(tab) for tab in self._check_tabs(key))
+    
+    def __len__(self):
+        with self.lock:
+            return sum(len(keys) for keys in self.keys.values())
+    
+    def update(self, keys):
+        with self.lock:
+            self._open()
+            for key in keys:
+                self._tab_keys(self._tab_for(key)).add(key)
+    
+    def load_for(self, keys):
+        """
+        Read the tabs the given keys would be checked against (so later checks make no API calls)
+        """
+        with self.lock:
+            self._open()
+            for key in keys:
+                for tab in self._check_tabs(key):
+                    self._tab_keys(tab)
+    
+    def _route(self, records):
+        """
+        Split records into (tab, records) groups, preserving their order within each tab
+        """
+        if self.mode == 'month':
+            groups = {}
+            for record in records:
+                groups.setdefault(month_tab_name(record.key[2], self.sheet_name), []).append(record)
+            return list(groups.items())
+        
+        groups = []
+        start = 0
+        while start < len(records):
+            tab = self._numbered(self.current)
+            if tab not in self.row_counts:
+                self.row_counts[tab] = len(self._tab_keys(tab))
+            room = self.max_rows - self.row_counts[tab]
+            if room <= 0:
+                # Start the next tab; only it and the one just filled are checked from now on
+                self.keys.pop(self._numbered(self.current - 1), None)
+                self.current += 1
+                continue
+            group = records[start:start + room]
+            # Reserved up front so concurrent appends do not overfill the tab
+            self.row_counts[tab] += len(group)
+            groups.append((tab, group))
+            start += len(group)
+        return groups
+    
+    def _ensure_tab(self, tab):
+        with self.lock:
+            if tab in self.ready:
+                return True
+            if not create_sheet_tab(self.service, self.spreadsheet_id, tab):
+                return False
+            self.ready.add(tab)
+            if self.tabs is not None:
+                self.tabs.add(tab)
+            return True
+    
+    def append(self, service, records):
+        """
+        Append records to their partition tabs, creating and initializing new tabs as needed
+        service: Sheets service used for the appends
+        Returns: list of the records whose rows landed
+        """
+        with self.lock:
+            self._open()
+            groups = self._route(records)
+        
+        landed = []
+        for tab, group in groups:
+            if self._ensure_tab(tab):
+                ranges = chunked_append_to_sheet(service, self.spreadsheet_id, tab, group)
+                done = [record for start, end in ranges for record in group[start:end]]
+            else:
+                done = []
+            with self.lock:
+                self._tab_keys(tab).update(record.key for record in done)
+                if tab in self.row_counts:
+                    # Release the room _route reserved for rows that did not land
+                    self.row_counts[tab] -= len(group) - len(done)
+            landed.extend(done)
+        return landed
+
+
+def open_partitions(sheets_service, rebuild_index=False):
+    """
+    Set up SHEET_PARTITION routing for the configured spreadsheet
+    Returns: SheetPartitions object
+    """
+    return SheetPartitions(
+        sheets_service,
+        config.SPREADSHEET_ID,
+        config.SHEET_NAME,
+        config.SHEET_PARTITION,
+        config.PARTITION_MAX_ROWS,
+        rebuild=rebuild_index
+    )
+
+
+def append_records(sheets_service, records, existing_emails):
+    """
+    Append parsed records to the sheet; with SHEET_PARTITION, existing_emails is the
+    SheetPartitions object and decides which tab each row goes to
+    Returns: list of the records whose rows landed
+    """
+    if isinstance(existing_emails, SheetPartitions):
+        return existing_emails.append(sheets_service, records)
+    
+    landed = chunked_append_to_sheet(
+        sheets_service,
+        config.SPREADSHEET_ID,
+        config.SHEET_NAME,
+        records
+    )
+    return [record for start, end in landed for record in records[start:end]]
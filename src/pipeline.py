@@ -0,0 +1,192 @@
+"""
+Pipeline module - overlaps Gmail fetch, parsing, sheet appends and mark-as-read with asyncio
+"""
+
+import asyncio
+import contextvars
+import functools
+from datetime import datetime
+
+import config
+from src.gmail_service import mark_emails_as_read
+from src.email_parser import parse_email_records
+from src.partitions import SheetPartitions, append_records
+from src import metrics
+
+# Queue marker telling a stage worker there is no more work
+_DONE = object()
+
+
+async def _to_thread(func, *args):
+    """
+    Run a blocking call in the event loop's default thread pool
+    Same as asyncio.to_thread, which needs Python 3.9
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, func, *args))
+
+
+async def _fetch_worker(pages, parse_queue, totals):
+    """
+    Pull pages from the (blocking) page iterator in a worker thread
+    The page iterator follows nextPageToken, so this stage always has a single worker
+    """
+    while True:
+        messages = await _to_thread(next, pages, None)
+        if messages is None:
+            return
+        totals['found'] += len(messages)
+        await parse_queue.put(messages)
+
+
+async def _parse_worker(parse_queue, append_queue, state, failed):
+    """
+    Parse pages of messages, dropping already processed IDs
+    IDs of emails that could not be parsed are added to failed
+    """
+    while True:
+        messages = await parse_queue.get()
+        if messages is _DONE:
+            return
+        
+        new_messages = [msg for msg in messages if msg['id'] not in state]
+        # Raw payloads are released as they are parsed; only compact records go downstream
+        messages.clear()
+        if not new_messages:
+            continue
+        
+        with metrics.stage('parse'):
+            message_ids = [msg['id'] for msg in new_messages]
+            records = await _to_thread(parse_email_records, new_messages)
+            failed.update(msg_id for msg_id, record in zip(message_ids, records) if not record)
+            records = [record for record in records if record]
+            metrics.count_items('parse', len(records))
+        if records:
+            await append_queue.put(records)
+
+
+async def _append_worker(sheets_service, append_queue, mark_queue, state, existing_emails, in_flight, totals):
+    """
+    Drop duplicates and append a page of parsed emails to the sheet
+    With USE_OUTBOX the page is saved to the outbox before the append
+    Only IDs whose rows were appended are passed on to be marked as read
+    """
+    while True:
+        records = await append_queue.get()
+        if records is _DONE:
+            return
+        
+        if isinstance(existing_emails, SheetPartitions):
+            # Reading partition tabs makes API calls; keep them off the event loop
+            await _to_thread(existing_emails.load_for, [record.key for record in records])
+        
+        # Runs on the event loop thread, so the duplicate check and reservation are atomic
+        batch = []
+        for record in records:
+            if record.key in existing_emails or record.key in in_flight:
+                print(f"Skipping duplicate: {record.subject}")
+                continue
+            in_flight.add(record.key)
+            batch.append(record)
+        
+        if not batch:
+            continue
+        
+        if config.USE_OUTBOX:
+            state.outbox_add(batch)
+        with metrics.stage('append'):
+            landed = await _to_thread(append_records, sheets_service, batch, existing_emails)
+            metrics.count_items('append', len(landed))
+        
+        in_flight.difference_update(record.key for record in batch)
+        totals['processed'] += len(batch)
+        
+        landed_ids = [record.message_id for record in landed]
+        existing_emails.update(record.key for record in landed)
+        
+        if len(landed_ids) < len(batch):
+            totals['append_failed'] = True
+        if landed_ids and config.USE_OUTBOX:
+            state.outbox_mark_appended(landed_ids)
+        if landed_ids:
+            totals['rows_added'] += len(landed_ids)
+            await mark_queue.put(landed_ids)
+
+
+async def _mark_worker(gmail_service, mark_queue, state):
+    """
+    Mark appended emails as read and record them in state
+    """
+    while True:
+        message_ids = await mark_queue.get()
+        if message_ids is _DONE:
+            return
+        
+        if config.MARK_AS_READ:
+            with metrics.stage('mark_read'):
+                await _to_thread(mark_emails_as_read, gmail_service, message_ids)
+                metrics.count_items('mark_read', len(message_ids))
+        
+        with metrics.stage('update_state'):
+            state.add_processed(message_ids)
+            state.set('last_run', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            metrics.count_items('update_state', len(message_ids))
+
+
+async def _run_stage(workers, downstream_queue=None, downstream_workers=0):
+    """
+    Wait for all workers of a stage, then tell each downstream worker to stop
+    """
+    await asyncio.gather(*workers)
+    for _ in range(downstream_workers):
+        await downstream_queue.put(_DONE)
+
+
+async def _run_pipeline(pages, gmail_service, sheets_service, state, existing_emails, failed):
+    parse_count = max(1, config.PIPELINE_PARSE_WORKERS)
+    append_count = max(1, config.PIPELINE_APPEND_WORKERS)
+    mark_count = max(1, config.PIPELINE_MARK_WORKERS)
+    
+    parse_queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    append_queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    mark_queue = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    
+    totals = {'found': 0, 'processed': 0, 'rows_added': 0, 'append_failed': False}
+    in_flight = set()
+    
+    await asyncio.gather(
+        _run_stage(
+            [_fetch_worker(pages, parse_queue, totals)],
+            parse_queue, parse_count
+        ),
+        _run_stage(
+            [_parse_worker(parse_queue, append_queue, state, failed) for _ in range(parse_count)],
+            append_queue, append_count
+        ),
+        _run_stage(
+            [_append_worker(sheets_service, append_queue, mark_queue, state, existing_emails, in_flight, totals)
+             for _ in range(append_count)],
+            mark_queue, mark_count
+        ),
+        _run_stage(
+            [_mark_worker(gmail_service, mark_queue, state) for _ in range(mark_count)]
+        )
+    )
+    
+    return totals
+
+
+def run_pipeline(pages, gmail_service, sheets_service, state, existing_emails, failed=None):
+    """
+    Process message pages through concurrent fetch, parse, append and mark-as-read stages
+    Stages are connected by bounded queues (PIPELINE_QUEUE_SIZE pages each), so fetching
+    continues while earlier pages are parsed and written
+    Every stage's worker threads share the caller's services, whose pooled transport
+    (auth.HttpPool) gives each request its own connection
+    An email is only marked as read after its row was appended
+    failed: optional set that receives the IDs of emails that could not be parsed
+    Returns: dict with found, processed, rows_added and append_failed
+    """
+    if failed is None:
+        failed = set()
+    return asyncio.run(_run_pipeline(pages, gmail_service, sheets_service, state, existing_emails, failed))
@@ -0,0 +1,168 @@
+"""
+Rate limiter module - token buckets that hold API calls back until their quota cost fits
+the configured budget, shared by every thread in the process (the pipeline's stages
+make their API calls from worker threads, so they are limited like any other caller)
+"""
+
+import random
+import threading
+import time
+
+import config
+from src.metrics import GMAIL_QUOTA_UNITS, record_stage
+
+# Sheets methods counted against the per-minute write quota (everything else is a read)
+SHEETS_WRITE_METHODS = {
+    'sheets.spreadsheets.batchUpdate',
+    'sheets.spreadsheets.values.append',
+    'sheets.spreadsheets.values.batchUpdate',
+    'sheets.spreadsheets.values.clear',
+    'sheets.spreadsheets.values.update',
+}
+
+_lock = threading.Lock()
+
+# Bucket name -> TokenBucket, built from RATE_LIMITS on first use
+_buckets = {}
+
+
+class TokenBucket:
+    """
+    Refills at budget tokens per seconds, holding at most budget tokens (the largest burst)
+    A call takes its cost up front and may leave the bucket in debt; it then waits until the
+    debt is paid off, so callers go through in the order they asked and never oversubscribe
+    """
+    
+    def __init__(self, budget, seconds):
+        self.capacity = float(budget)
+        self.rate = budget / seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self, cost):
+        """
+        Take cost tokens
+        Returns: seconds to wait before making the call
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= cost
+            return max(0.0, -self.tokens / self.rate)
+    
+    def drain(self):
+        """
+        Empty the bucket, so every caller waits for it to refill (after the API reports a rate limit)
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+def get_bucket(name):
+    """
+    Get the shared bucket for 'gmail', 'sheets.read' or 'sheets.write'
+    Returns: TokenBucket, or None if RATE_LIMITS has no budget for it
+    """
+    with _lock:
+        if name not in _buckets:
+            limit = config.RATE_LIMITS.get(name)
+            _buckets[name] = TokenBucket(*limit) if limit else None
+        return _buckets[name]
+
+
+def reset():
+    """
+    Forget all buckets, so the next call rebuilds them from RATE_LIMITS
+    """
+    with _lock:
+        _buckets.clear()
+
+
+def quota_cost(method_id):
+    """
+    Bucket and cost of one call to an API method, e.g. 'gmail.users.messages.get'
+    Returns: tuple (bucket name, cost), or (None, 0) for methods without a quota
+    """
+    method_id = method_id or ''
+    if method_id.startswith('gmail.'):
+        # Methods missing from the table are charged like messages.get
+        return 'gmail', GMAIL_QUOTA_UNITS.get(method_id, 5)
+    if method_id.startswith('sheets.'):
+        return ('sheets.write' if method_id in SHEETS_WRITE_METHODS else 'sheets.read'), 1
+    return None, 0
+
+
+def acquire(method_id, calls=1):
+    """
+    Block until calls calls to method_id fit the budget
+    Returns: seconds waited
+    """
+    if not config.USE_RATE_LIMITER:
+        return 0.0
+    name, cost = quota_cost(method_id)
+    bucket = get_bucket(name) if name else None
+    if bucket is None:
+        return 0.0
+    wait = bucket.reserve(cost * calls)
+    if wait:
+        # Time spent held back shows up as its own stage in the run report
+        record_stage('rate_limit', seconds=wait, items=calls, runs=1)
+        time.sleep(wait)
+    return wait
+
+
+def report_rate_limited(method_id):
+    """
+    Called when the API answered 429 despite the budget: empty the method's bucket so all
+    callers back off together instead of retrying into the limit
+    """
+    if not config.USE_RATE_LIMITER:
+        return
+    name, _ = quota_cost(method_id)
+    bucket = get_bucket(name) if name else None
+    if bucket is not None:
+        bucket.drain()
+
+
+def is_rate_limit_error(error):
+    """
+    Check whether an exception is a 429 (or Gmail's 403 rateLimitExceeded / userRateLimitExceeded)
+    """
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status == 429:
+        return True
+    return status == 403 and 'ratelimitexceeded' in str(getattr(error, 'content', b'')).lower()
+
+
+def is_retryable_error(error):
+    """
+    Check whether an exception is worth retrying: a rate limit (see is_rate_limit_error)
+    or a server (5xx) error
+    """
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return is_rate_limit_error(error) or (status is not None and 500 <= status < 600)
+
+
+def call_with_retry(call, max_retries, api):
+    """
+    Run call(), retrying rate-limit and server errors with jittered exponential
+    backoff (BACKOFF_BASE, BACKOFF_MAX)
+    api: name for the retry messages, e.g. 'Gmail'
+    Returns: call's result; raises its last error, or the first one not worth retrying
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception as error:
+            if not is_retryable_error(error) or attempt == max_retries:
+                raise
+            # Full jitter: sleep a random time up to the exponential backoff cap
+            delay = random.uniform(0, min(config.BACKOFF_MAX, config.BACKOFF_BASE * 2 ** attempt))
+            print(f"{api} returned {error.resp.status}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
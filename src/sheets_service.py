@@ -2,65 +2,23 @@
 Google Sheets Service Module - Handles Sheets API authentication and operations
 """
 
-import os
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import json
 from googleapiclient.errors import HttpError
 
 import config
+from src.auth import build_service
+from src.dedup_keys import KeyHashSet
+from src.rate_limiter import call_with_retry
 
 
 def authenticate_sheets():
     """
     Authenticate with Google Sheets API using OAuth 2.0
+    Credentials are shared with the other services built in this process
     Returns: Sheets API service object
     """
-    creds = None
-    
-    # Combine all scopes (Gmail + Sheets) for single authentication
-    ALL_SCOPES = config.GMAIL_SCOPES + config.SHEETS_SCOPES
-    
-    # Token file stores the user's access and refresh tokens
-    if os.path.exists(config.TOKEN_FILE):
-        try:
-            creds = Credentials.from_authorized_user_file(config.TOKEN_FILE, ALL_SCOPES)
-        except Exception as e:
-            print(f"Error loading credentials: {e}")
-            creds = None
-    
-    # If no valid credentials, let user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                print("Refreshing access token...")
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Error refreshing token: {e}")
-                creds = None
-        
-        if not creds:
-            if not os.path.exists(config.CREDENTIALS_FILE):
-                raise FileNotFoundError(
-                    f"Credentials file not found at {config.CREDENTIALS_FILE}\n"
-                    "Please download credentials.json from Google Cloud Console"
-                )
-            
-            print("Starting OAuth 2.0 flow for Gmail AND Sheets...")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                config.CREDENTIALS_FILE,
-                ALL_SCOPES  # Request both Gmail and Sheets scopes
-            )
-            creds = flow.run_local_server(port=0)
-            print("Authentication successful!")
-        
-        # Save credentials for future runs
-        with open(config.TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
-    
     try:
-        service = build('sheets', 'v4', credentials=creds)
+        service = build_service('sheets', 'v4')
         print("Sheets service initialized successfully")
         return service
     except HttpError as error:
@@ -68,30 +26,50 @@ def authenticate_sheets():
         return None
 
 
+def sheet_headers():
+    """
+    Column headers of the sheet: SHEET_HEADERS, plus Message-ID (column E) with DEDUP_KEY = 'message_id'
+    """
+    if config.DEDUP_KEY == 'message_id':
+        return config.SHEET_HEADERS + ['Message-ID']
+    return config.SHEET_HEADERS
+
+
+def last_column():
+    """
+    Letter of the sheet's last column, e.g. 'D'
+    """
+    return chr(ord('A') + len(sheet_headers()) - 1)
+
+
 def initialize_sheet(service, spreadsheet_id, sheet_name):
     """
     Initialize the sheet with headers if not already present
     """
+    headers = sheet_headers()
+    header_range = f'{sheet_name}!A1:{last_column()}1'
     try:
         # Check if headers exist
         result = service.spreadsheets().values().get(
             spreadsheetId=spreadsheet_id,
-            range=f'{sheet_name}!A1:D1'
+            range=header_range,
+            fields=config.FIELD_MASKS.get('sheets.values.get')
         ).execute()
         
         values = result.get('values', [])
         
-        if not values or values[0] != config.SHEET_HEADERS:
+        if not values or values[0] != headers:
             # Headers don't exist or are incorrect, write them
             print("Writing headers to sheet...")
             body = {
-                'values': [config.SHEET_HEADERS]
+                'values': [headers]
             }
             service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
-                range=f'{sheet_name}!A1:D1',
+                range=header_range,
                 valueInputOption='RAW',
-                body=body
+                body=body,
+                fields=config.FIELD_MASKS.get('sheets.values.update')
             ).execute()
             print("Headers written successfully")
         else:
@@ -127,7 +105,8 @@ def append_to_sheet(service, spreadsheet_id, sheet_name, email_data):
             range=f'{sheet_name}!A:D',
             valueInputOption='RAW',
             insertDataOption='INSERT_ROWS',
-            body=body
+            body=body,
+            fields=config.FIELD_MASKS.get('sheets.values.append')
         ).execute()
         
         return True
@@ -167,7 +146,8 @@ def batch_append_to_sheet(service, spreadsheet_id, sheet_name, emails_data):
             range=f'{sheet_name}!A:D',
             valueInputOption='RAW',
             insertDataOption='INSERT_ROWS',
-            body=body
+            body=body,
+            fields=config.FIELD_MASKS.get('sheets.values.append')
         ).execute()
         
         updates = result.get('updates', {})
@@ -181,37 +161,199 @@ def batch_append_to_sheet(service, spreadsheet_id, sheet_name, emails_data):
         return 0
 
 
-def get_existing_emails(service, spreadsheet_id, sheet_name):
+def email_to_row(email_data):
     """
-    Get all existing email subjects and dates from the sheet to check for duplicates
-    Returns: set of tuples (from, subject, date)
+    Convert parsed email data (a parse_email dict or a ParsedEmail record) to a sheet row
+    """
+    if not isinstance(email_data, dict):
+        return email_data.to_row()
+    return [
+        email_data.get('From', ''),
+        email_data.get('Subject', ''),
+        email_data.get('Date', ''),
+        email_data.get('Content', '')
+    ]
+
+
+def chunk_rows(rows, max_bytes):
+    """
+    Split rows into chunks whose JSON-encoded size stays under max_bytes
+    A single row larger than max_bytes gets a chunk of its own
+    Returns: list of (start, end) index ranges
+    """
+    chunks = []
+    start = 0
+    size = 0
+    for i, row in enumerate(rows):
+        # Same encoding the API client uses for the request body
+        row_size = len(json.dumps(row)) + 1
+        if i > start and size + row_size > max_bytes:
+            chunks.append((start, i))
+            start = i
+            size = 0
+        size += row_size
+    if start < len(rows):
+        chunks.append((start, len(rows)))
+    return chunks
+
+
+def append_rows_with_retry(service, spreadsheet_id, sheet_name, rows):
+    """
+    Append rows with one values.append call, retrying rate-limit and 5xx errors
+    with jittered exponential backoff
+    Returns: number of rows added (0 if the rows did not land)
     """
+    body = {
+        'values': rows
+    }
+    request = service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=f'{sheet_name}!A:{last_column()}',
+        valueInputOption='RAW',
+        insertDataOption='INSERT_ROWS',
+        body=body,
+        fields=config.FIELD_MASKS.get('sheets.values.append')
+    )
+    
     try:
-        result = service.spreadsheets().values().get(
+        result = call_with_retry(request.execute, config.APPEND_MAX_RETRIES, 'Sheets')
+        return result.get('updates', {}).get('updatedRows', 0)
+    except HttpError as error:
+        print(f"Error appending {len(rows)} row(s) to sheet: {error}")
+        return 0
+
+
+def chunked_append_to_sheet(service, spreadsheet_id, sheet_name, emails_data, max_bytes=None):
+    """
+    Append emails to the sheet in chunks under max_bytes (APPEND_MAX_BYTES by default)
+    Each chunk is retried on rate-limit and server errors; a failed chunk does not stop the rest
+    emails_data: list of parse_email dicts or ParsedEmail records
+    Returns: list of (start, end) index ranges of emails_data whose rows landed
+    """
+    if not emails_data:
+        print("No data to append")
+        return []
+    
+    if max_bytes is None:
+        max_bytes = config.APPEND_MAX_BYTES
+    
+    rows = [email_to_row(email_data) for email_data in emails_data]
+    chunks = chunk_rows(rows, max_bytes)
+    
+    landed = []
+    rows_added = 0
+    for start, end in chunks:
+        added = append_rows_with_retry(service, spreadsheet_id, sheet_name, rows[start:end])
+        if added > 0:
+            landed.append((start, end))
+            rows_added += added
+    
+    print(f"Successfully added {rows_added} row(s) to sheet in {len(landed)}/{len(chunks)} chunk(s)")
+    return landed
+
+
+def get_email_keys(service, spreadsheet_id, sheet_name, start_row=2):
+    """
+    Read only the duplicate-check columns from start_row onwards: From, Subject, Date and,
+    with DEDUP_KEY = 'message_id', Message-ID (the Content column is skipped)
+    Returns: list of rows, or None on error
+    """
+    try:
+        if config.DEDUP_KEY != 'message_id':
+            result = service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f'{sheet_name}!A{start_row}:C',
+                fields=config.FIELD_MASKS.get('sheets.values.get')
+            ).execute()
+        
+            return result.get('values', [])
+        
+        result = service.spreadsheets().values().batchGet(
             spreadsheetId=spreadsheet_id,
-            range=f'{sheet_name}!A2:D'  # Skip header row
+            ranges=[f'{sheet_name}!A{start_row}:C', f'{sheet_name}!E{start_row}:E'],
+            fields=config.FIELD_MASKS.get('sheets.values.batchGet')
         ).execute()
         
-        values = result.get('values', [])
-        
-        # Create set of unique identifiers (from + subject + date)
-        existing = set()
-        for row in values:
-            if len(row) >= 3:
-                # Create tuple of (From, Subject, Date)
-                identifier = (
-                    row[0] if len(row) > 0 else '',
-                    row[1] if len(row) > 1 else '',
-                    row[2] if len(row) > 2 else ''
-                )
-                existing.add(identifier)
-        
-        print(f"Found {len(existing)} existing email(s) in sheet")
-        return existing
+        # Trailing empty rows are left out of each range, so pad the shorter one
+        headers, ids = [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+        rows = []
+        for i in range(max(len(headers), len(ids))):
+            row = headers[i] if i < len(headers) else []
+            message_id = ids[i] if i < len(ids) else []
+            rows.append((row + [''] * (3 - len(row)) + message_id[:1]) if message_id else row)
+        return rows
         
     except HttpError as error:
         if error.resp.status == 404:
             print(f"Sheet '{sheet_name}' not found")
         else:
             print(f"Error reading existing emails: {error}")
-        return set()
\ No newline at end of file
+        return None
+
+
+def row_to_key(row):
+    """
+    Duplicate-check key of a sheet row read by get_email_keys
+    Rows logged before the Message-ID column existed keep their (From, Subject, Date) key
+    Returns: tuple, or None for rows without the key columns
+    """
+    if len(row) < 3:
+        return None
+    return tuple(row[:4])
+
+
+def get_existing_emails(service, spreadsheet_id, sheet_name):
+    """
+    Get all existing email subjects and dates from the sheet to check for duplicates
+    Returns: KeyHashSet of (from, subject, date) keys (with message keys, if logged)
+    """
+    values = get_email_keys(service, spreadsheet_id, sheet_name)  # Skip header row
+    if values is None:
+        return KeyHashSet()
+    
+    # Create set of unique identifiers (from + subject + date, or message key)
+    existing = KeyHashSet(key for key in map(row_to_key, values) if key)
+    
+    print(f"Found {len(existing)} existing email(s) in sheet")
+    return existing
+
+
+def list_sheet_tabs(service, spreadsheet_id):
+    """
+    Get the titles of the tabs in the spreadsheet
+    Returns: list of tab names, or None on error
+    """
+    try:
+        result = service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields=config.FIELD_MASKS.get('sheets.spreadsheets.get')
+        ).execute()
+        
+        return [sheet['properties']['title'] for sheet in result.get('sheets', [])]
+        
+    except HttpError as error:
+        print(f"Error listing sheet tabs: {error}")
+        return None
+
+
+def create_sheet_tab(service, spreadsheet_id, sheet_name):
+    """
+    Add a tab to the spreadsheet and write the headers to it
+    Returns: True if the tab is ready to use
+    """
+    try:
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]},
+            fields=config.FIELD_MASKS.get('sheets.spreadsheets.batchUpdate')
+        ).execute()
+        print(f"Created sheet tab '{sheet_name}'")
+        
+    except HttpError as error:
+        # Another run may have created it in the meantime
+        if 'already exists' not in str(error):
+            print(f"Error creating sheet tab '{sheet_name}': {error}")
+            return False
+    
+    initialize_sheet(service, spreadsheet_id, sheet_name)
+    return True
@@ -0,0 +1,326 @@
+"""
+State store module - tracks processed message IDs, run checkpoints and the outbox
+of parsed emails waiting to be written to the sheet
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from src.email_parser import ParsedEmail
+
+PRUNE_INTERVAL = 86400  # Seconds between retention prunes (the time of the last one is kept in meta)
+
+
+class JsonStateStore:
+    """
+    Original state.json backend: the whole ID list is loaded and rewritten on every save
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.state = self._load()
+        self.processed_ids = set(self.state.get('processed_message_ids', []))
+        # message ID -> {'key': [from, subject, date], 'content': ..., 'appended': bool}
+        self.outbox = self.state.setdefault('outbox', {})
+    
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+                    print(f"Loaded state: {len(state.get('processed_message_ids', []))} processed email(s)")
+                    return state
+            except Exception as e:
+                print(f"Error loading state: {e}")
+                return {'processed_message_ids': []}
+        else:
+            print("No state file found, starting fresh")
+            return {'processed_message_ids': []}
+    
+    def _save(self):
+        try:
+            self.state['processed_message_ids'] = list(self.processed_ids)
+            with open(self.path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            print(f"State saved: {len(self.processed_ids)} total processed email(s)")
+        except Exception as e:
+            print(f"Error saving state: {e}")
+    
+    def __contains__(self, message_id):
+        return message_id in self.processed_ids
+    
+    def __len__(self):
+        return len(self.processed_ids)
+    
+    def add_processed(self, message_ids):
+        message_ids = list(message_ids)
+        self.processed_ids.update(message_ids)
+        for msg_id in message_ids:
+            self.outbox.pop(msg_id, None)
+        self._save()
+    
+    def outbox_add(self, records):
+        for record in records:
+            if record.message_id not in self.outbox:
+                self.outbox[record.message_id] = {
+                    'key': list(record.key),
+                    'content': record.content,
+                    'appended': False
+                }
+        self._save()
+    
+    def outbox_mark_appended(self, message_ids):
+        for msg_id in message_ids:
+            if msg_id in self.outbox:
+                self.outbox[msg_id]['appended'] = True
+        self._save()
+    
+    def outbox_records(self):
+        return [
+            (ParsedEmail(msg_id, tuple(entry['key']), entry['content']), entry['appended'])
+            for msg_id, entry in self.outbox.items()
+        ]
+    
+    def in_outbox(self, message_id):
+        return message_id in self.outbox
+    
+    def outbox_count(self):
+        return len(self.outbox)
+    
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+    
+    def set(self, key, value):
+        self.state[key] = value
+        self._save()
+    
+    def prune(self, max_age_days):
+        # state.json does not record when an ID was processed
+        return 0
+    
+    def close(self):
+        pass
+
+
+class SqliteStateStore:
+    """
+    SQLite backend: indexed membership checks, inserts only new IDs,
+    and supports age-based retention
+    Recording an email as processed removes it from the outbox in the same transaction
+    Safe to share between threads (all access goes through one lock)
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS processed '
+            '(message_id TEXT PRIMARY KEY, processed_at REAL NOT NULL) WITHOUT ROWID'
+        )
+        # Lets prune() find old IDs without scanning the whole table
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS processed_at_idx ON processed (processed_at)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox '
+            '(message_id TEXT PRIMARY KEY, sender TEXT NOT NULL, subject TEXT NOT NULL, '
+            'date TEXT NOT NULL, content TEXT NOT NULL, appended INTEGER NOT NULL DEFAULT 0, '
+            'message_key TEXT)'
+        )
+        # Outbox tables created before DEDUP_KEY = 'message_id' existed
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(outbox)')]
+        if 'message_key' not in columns:
+            self.conn.execute('ALTER TABLE outbox ADD COLUMN message_key TEXT')
+        self.conn.commit()
+        print(f"Loaded state from {path}")
+    
+    def __contains__(self, message_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM processed WHERE message_id = ?', (message_id,)
+            ).fetchone()
+        return row is not None
+    
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM processed').fetchone()[0]
+    
+    def add_processed(self, message_ids, processed_at=None):
+        if processed_at is None:
+            processed_at = time.time()
+        message_ids = list(message_ids)
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO processed (message_id, processed_at) VALUES (?, ?)',
+                    ((msg_id, processed_at) for msg_id in message_ids)
+                )
+                self.conn.executemany(
+                    'DELETE FROM outbox WHERE message_id = ?',
+                    ((msg_id,) for msg_id in message_ids)
+                )
+            print(f"State saved: {len(message_ids)} new processed email(s)")
+        except sqlite3.Error as e:
+            print(f"Error saving state: {e}")
+    
+    def outbox_add(self, records):
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO outbox (message_id, sender, subject, date, content, message_key) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (
+                        (record.message_id, *record.key[:3], record.content,
+                         record.key[3] if len(record.key) > 3 else None)
+                        for record in records
+                    )
+                )
+        except sqlite3.Error as e:
+            print(f"Error saving outbox: {e}")
+    
+    def outbox_mark_appended(self, message_ids):
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    'UPDATE outbox SET appended = 1 WHERE message_id = ?',
+                    ((msg_id,) for msg_id in message_ids)
+                )
+        except sqlite3.Error as e:
+            print(f"Error saving outbox: {e}")
+    
+    def outbox_records(self):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT message_id, sender, subject, date, content, appended, message_key '
+                'FROM outbox ORDER BY rowid'
+            ).fetchall()
+        return [
+            (
+                ParsedEmail(
+                    msg_id,
+                    (sender, subject, date) + ((message_key,) if message_key is not None else ()),
+                    content
+                ),
+                bool(appended)
+            )
+            for msg_id, sender, subject, date, content, appended, message_key in rows
+        ]
+    
+    def in_outbox(self, message_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM outbox WHERE message_id = ?', (message_id,)
+            ).fetchone()
+        return row is not None
+    
+    def outbox_count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+    
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def set(self, key, value):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value)
+                )
+        except sqlite3.Error as e:
+            print(f"Error saving state: {e}")
+    
+    def prune(self, max_age_days):
+        """
+        Forget IDs processed more than max_age_days ago
+        Returns: number of IDs removed
+        """
+        cutoff = time.time() - max_age_days * 86400
+        with self.lock, self.conn:
+            removed = self.conn.execute(
+                'DELETE FROM processed WHERE processed_at < ?', (cutoff,)
+            ).rowcount
+        if removed:
+            print(f"Pruned {removed} processed email(s) older than {max_age_days} day(s)")
+        return removed
+    
+    def migrate_json(self, json_path):
+        """
+        One-time import of an existing state.json file
+        The old file is renamed to <name>.migrated so it is not imported twice
+        """
+        try:
+            with open(json_path, 'r') as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"Error reading {json_path} for migration: {e}")
+            return
+        
+        message_ids = state.get('processed_message_ids', [])
+        self.add_processed(message_ids)
+        for key in ('last_run', 'history_id'):
+            if state.get(key):
+                self.set(key, state[key])
+        
+        outbox = state.get('outbox', {})
+        self.outbox_add(
+            ParsedEmail(msg_id, tuple(entry['key']), entry['content'])
+            for msg_id, entry in outbox.items()
+        )
+        self.outbox_mark_appended(msg_id for msg_id, entry in outbox.items() if entry['appended'])
+        
+        os.replace(json_path, json_path + '.migrated')
+        print(f"Migrated {len(message_ids)} processed email(s) from {json_path}")
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def open_state_store(backend=None, path=None, json_path=None):
+    """
+    Open the configured state backend ('sqlite' or 'json')
+    Returns: state store object
+    """
+    if backend is None:
+        backend = config.STATE_BACKEND
+    if json_path is None:
+        json_path = config.STATE_FILE
+    
+    if backend == 'json':
+        return JsonStateStore(json_path)
+    
+    if path is None:
+        path = config.STATE_DB_FILE
+    store = SqliteStateStore(path)
+    
+    if os.path.exists(json_path):
+        store.migrate_json(json_path)
+    
+    prune_if_due(store)
+    return store
+
+
+def prune_if_due(store):
+    """
+    Apply STATE_RETENTION_DAYS at most once every PRUNE_INTERVAL seconds
+    Returns: number of IDs removed
+    """
+    if not config.STATE_RETENTION_DAYS:
+        return 0
+    
+    now = time.time()
+    if now - float(store.get('last_prune', 0)) < PRUNE_INTERVAL:
+        return 0
+    removed = store.prune(config.STATE_RETENTION_DAYS)
+    store.set('last_prune', str(now))
+    return removed